@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""Build a synthetic blog of N posts with the site configuration.
+
+Reports read, resolve and write times and peak memory for a clean build and
+incremental builds after editing one post's body and one post's metadata.
+
+    ./bench/bench_build.py --sizes 100,1000,3000 --diagrams 2
+"""
+
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+repo_dir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+content_dir: str = os.path.join(repo_dir, "content")
+
+# pages every post listing needs, copied from the real site
+site_pages: List[str] = [
+    "index.md",
+    "recent.md",
+    "archive.md",
+    "tags.md",
+    "about.md",
+    "privacy.md",
+]
+
+tags: List[str] = [
+    "NixOS",
+    "Router",
+    "Server",
+    "Linux",
+    "Cryptography",
+    "Security",
+    "ZFS",
+    "Networking",
+    "Rust",
+    "Firmware",
+]
+
+paragraph: str = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim "
+    "veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea "
+    "commodo consequat."
+)
+
+svgbob_stub: str = """#!{python}
+import sys
+
+if "--version" in sys.argv:
+    print("svgbob 0.0.0-stub")
+    sys.exit(0)
+
+lines = sys.stdin.read().splitlines()
+width = max((len(line) for line in lines), default=0) * 8
+height = len(lines) * 16
+print(f'<svg xmlns="http://www.w3.org/2000/svg" width="{{width}}" height="{{height}}">')
+for row, line in enumerate(lines):
+    print(f'<text x="0" y="{{row * 16 + 12}}">{{len(line)}}</text>')
+print("</svg>")
+"""
+
+
+def post_source(index: int, rng: random.Random, diagrams: int) -> str:
+    year = 2000 + index % 25
+    month = 1 + index % 12
+    day = 1 + index % 28
+    post_tags = ", ".join(rng.sample(tags, 2))
+
+    parts = [
+        f"# Synthetic post {index}\n",
+        f"```{{blogpost}} {year}-{month:02}-{day:02}\n:tags: {post_tags}\n```\n",
+    ]
+    for section in range(8):
+        parts.append(f"## Section {section}\n")
+        parts.append(paragraph + "\n")
+        parts.append("```bash\necho hello\n```\n")
+    for diagram in range(diagrams):
+        parts.append(
+            "```{svgbob}\n"
+            f"+--------+     +----------+\n"
+            f"| post {index:<3}|---->| figure {diagram:<2}|\n"
+            f"+--------+     +----------+\n"
+            "```\n"
+        )
+    return "\n".join(parts)
+
+
+def post_path(srcdir: str, index: int) -> str:
+    return os.path.join(srcdir, "posts", str(index), "index.md")
+
+
+def generate(srcdir: str, posts: int, diagrams: int, seed: int):
+    rng = random.Random(seed)
+    for page in site_pages:
+        shutil.copy(os.path.join(content_dir, page), srcdir)
+    for index in range(posts):
+        path = post_path(srcdir, index)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(post_source(index, rng, diagrams))
+
+
+def build_one(args: argparse.Namespace):
+    """Run a single build in this process and print its timings as JSON."""
+    from sphinx.application import Sphinx
+
+    times: Dict[str, float] = {"read": 0.0, "resolve": 0.0}
+    marks: Dict[str, float] = {}
+
+    def read_started(app: Sphinx, env: Any, docnames: List[str]):
+        marks["read"] = time.perf_counter()
+
+    def read_finished(app: Sphinx, env: Any):
+        marks["write"] = time.perf_counter()
+        times["read"] += marks["write"] - marks["read"]
+
+    def resolve_started(app: Sphinx, doctree: Any, docname: str):
+        marks["resolve"] = time.perf_counter()
+
+    def resolve_finished(app: Sphinx, doctree: Any, docname: str):
+        times["resolve"] += time.perf_counter() - marks["resolve"]
+
+    confoverrides = dict(override.split("=", 1) for override in args.override)
+    app = Sphinx(
+        srcdir=args.srcdir,
+        confdir=content_dir,
+        outdir=args.outdir,
+        doctreedir=os.path.join(args.outdir, ".doctrees"),
+        buildername=args.builder,
+        confoverrides=confoverrides,
+        status=None,
+        warning=None,
+        parallel=args.jobs,
+    )
+    app.connect("env-before-read-docs", read_started)
+    app.connect("env-updated", read_finished, priority=999)
+    # only seen in this process, resolve is not measured with --jobs > 1
+    app.connect("doctree-resolved", resolve_started, priority=0)
+    app.connect("doctree-resolved", resolve_finished, priority=999)
+
+    start = time.perf_counter()
+    app.build()
+    total = time.perf_counter() - start
+
+    times["write"] = time.perf_counter() - marks.get("write", start) - times["resolve"]
+    times["total"] = total
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # kibibytes on Linux
+    times["peak_mib"] = usage / 1024
+    print(json.dumps(times))
+
+
+def run_build(args: argparse.Namespace, srcdir: str, outdir: str, env: Dict[str, str]):
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--build-one",
+        "--srcdir",
+        srcdir,
+        "--outdir",
+        outdir,
+        "--builder",
+        args.builder,
+        "--jobs",
+        str(args.jobs),
+    ]
+    for override in args.override:
+        cmd += ["--override", override]
+    proc = subprocess.run(
+        cmd, stdout=subprocess.PIPE, encoding="utf-8", env=env, check=True
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def bench_size(
+    args: argparse.Namespace, posts: int, workdir: str, env: Dict[str, str]
+) -> Dict[str, Any]:
+    srcdir = os.path.join(workdir, f"src-{posts}")
+    outdir = os.path.join(workdir, f"out-{posts}")
+    os.makedirs(srcdir)
+    generate(srcdir, posts, args.diagrams, args.seed)
+
+    results = {"posts": posts, "diagrams": posts * args.diagrams}
+    results["clean"] = run_build(args, srcdir, outdir, env)
+
+    # body edit, only the post should be rebuilt
+    with open(post_path(srcdir, 0), "a", encoding="utf-8") as f:
+        f.write("\n" + paragraph + "\n")
+    results["incremental_body"] = run_build(args, srcdir, outdir, env)
+
+    # title edit, the listings are rebuilt too
+    path = post_path(srcdir, 0)
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source.replace("# Synthetic post 0", "# Renamed synthetic post 0", 1))
+    results["incremental_metadata"] = run_build(args, srcdir, outdir, env)
+
+    shutil.rmtree(srcdir)
+    shutil.rmtree(outdir)
+    return results
+
+
+def print_table(results: List[Dict[str, Any]]):
+    header = (
+        f"{'posts':>6} {'build':<22} {'read':>8} {'resolve':>8} "
+        f"{'write':>8} {'total':>8} {'peak MiB':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        for build in ["clean", "incremental_body", "incremental_metadata"]:
+            times = result[build]
+            print(
+                f"{result['posts']:>6} {build:<22} "
+                f"{times['read']:>8.2f} {times['resolve']:>8.2f} "
+                f"{times['write']:>8.2f} {times['total']:>8.2f} "
+                f"{times['peak_mib']:>9.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", default="100,1000", help="comma separated post counts"
+    )
+    parser.add_argument("--diagrams", type=int, default=0, help="diagrams per post")
+    parser.add_argument("--builder", default="dirhtml")
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-D",
+        "--override",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="override a configuration value, like sphinx-build -D",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--build-one", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--srcdir", help=argparse.SUPPRESS)
+    parser.add_argument("--outdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build_one:
+        build_one(args)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="blog-bench-") as workdir:
+        stub_dir = os.path.join(workdir, "bin")
+        os.makedirs(stub_dir)
+        stub_path = os.path.join(stub_dir, "svgbob")
+        with open(stub_path, "w", encoding="utf-8") as f:
+            f.write(svgbob_stub.format(python=sys.executable))
+        os.chmod(stub_path, 0o755)
+        env = dict(os.environ, PATH=stub_dir + os.pathsep + os.environ["PATH"])
+
+        results = []
+        for size in args.sizes.split(","):
+            results.append(bench_size(args, int(size), workdir, env))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
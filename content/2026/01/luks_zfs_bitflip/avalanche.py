@@ -0,0 +1,41 @@
+"""Avalanche statistics over many AES blocks with a bit flip.
+
+Shared by encryption_example.py and decryption_example.py.
+"""
+
+import numpy as np
+
+
+def flip_bits(blocks: np.ndarray, bits: np.ndarray) -> np.ndarray:
+    """Copy of 16 byte *blocks* with one bit of each flipped, bit 0 is the
+    lowest bit of the first byte as in the examples."""
+    flipped = blocks.copy()
+    flipped[np.arange(len(blocks)), bits // 8] ^= (1 << (bits % 8)).astype(np.uint8)
+    return flipped
+
+
+def hamming_distances(context, blocks: np.ndarray, flipped: np.ndarray) -> np.ndarray:
+    """Bits that differ between the outputs of each pair of blocks.
+
+    *context* is an ECB encryptor or decryptor, one call handles all blocks
+    as ECB processes each block on its own.
+    """
+    a = np.frombuffer(context.update(blocks.tobytes()), dtype=np.uint64)
+    b = np.frombuffer(context.update(flipped.tobytes()), dtype=np.uint64)
+    return np.bitwise_count(a ^ b).reshape(-1, 2).sum(axis=1)
+
+
+def print_statistics(title: str, distances: np.ndarray, elapsed: float):
+    print()
+    print(f"{title}: {len(distances)} blocks in {elapsed * 1e3:.1f} ms")
+    print(
+        f"Hamming distance:      mean {distances.mean():.2f}, "
+        f"std {distances.std():.2f}, min {distances.min()}, max {distances.max()} "
+        "(ideal mean 64, std 5.66)"
+    )
+    # distribution in buckets of 4 bits
+    counts = np.bincount(distances // 4, minlength=33)
+    for bucket in np.flatnonzero(counts):
+        share = counts[bucket] / len(distances)
+        bar = "#" * round(share * 100)
+        print(f"{bucket * 4:3}-{bucket * 4 + 3:3}: {share:6.2%} {bar}".rstrip())
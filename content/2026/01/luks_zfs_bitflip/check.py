@@ -1,17 +1,125 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import ProcessPoolExecutor
+from fill import mib, parse_pattern, pattern_block
+import argparse
+import functools
+import mmap
 import os
+import sys
+import time
 
-mib: int = 1024 * 1024
-aa: bytes = bytes([0b10101010]) * mib
-test_dir: str = "/test"
+block: int = 4096
 
-for name in os.listdir(test_dir):
-    path = os.path.join(test_dir, name)
+
+def mismatches(
+    data: memoryview, expected: bytes, offset: int, limit: int
+) -> list[tuple[int, int, int]]:
+    """Offset, expected and actual value of the first *limit* bytes that differ,
+    all of them for 0."""
+    found = []
+    for i in range(0, len(data), block):
+        chunk = data[i : i + block]
+        if expected.startswith(chunk, i):
+            continue
+        for j, value in enumerate(chunk, i):
+            if value != expected[j]:
+                found.append((offset + j, expected[j], value))
+                if len(found) == limit:
+                    return found
+    return found
+
+
+def count_mismatches(data: memoryview, expected: bytes) -> int:
+    xor = int.from_bytes(data) ^ int.from_bytes(expected[: len(data)])
+    return len(data) - xor.to_bytes(len(data)).count(0)
+
+
+def check(
+    pattern: str, seed: int, limit: int, path: str
+) -> tuple[str, int, int, list[tuple[int, int, int]]]:
+    """Compare a file with the pattern written by fill.py one MiB at a time.
+
+    Returns the number of bytes that differ, and the first *limit* of them.
+    """
+    expected = pattern_block(pattern, seed, os.path.basename(path))
+    count = 0
+    found = []
     with open(path, "rb") as f:
-        data = f.read()
-    if data != aa:
-        print("FAIL:", path)
-        break
-    else:
-        print("PASS:", path)
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return path, size, count, found
+        with (
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m,
+            memoryview(m) as view,
+        ):
+            m.madvise(mmap.MADV_SEQUENTIAL)
+            for offset in range(0, size, mib):
+                # slicing the mmap copies, bytes.startswith compares a view of
+                # it in place
+                with view[offset : offset + mib] as data:
+                    if expected.startswith(data):
+                        continue
+                    count += count_mismatches(data, expected)
+                    if not limit or len(found) < limit:
+                        found += mismatches(data, expected, offset, limit - len(found))
+    return path, size, count, found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Check files written by fill.py for flipped bits"
+    )
+    parser.add_argument("test_dir", nargs="?", default="/test")
+    parser.add_argument(
+        "--pattern",
+        type=parse_pattern,
+        default="aa",
+        help="hex byte, or seeded (default: aa)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=100,
+        help="bytes listed per file, 0 for all (default: 100)",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    # numeric order of the names written by fill.py
+    names = sorted(os.listdir(args.test_dir), key=lambda name: (len(name), name))
+    paths = [os.path.join(args.test_dir, name) for name in names]
+    failed = 0
+    total = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        check_file = functools.partial(check, args.pattern, args.seed, args.limit)
+        for path, size, count, found in executor.map(check_file, paths, chunksize=4):
+            total += size
+            if not count:
+                print("PASS:", path)
+                continue
+            failed += 1
+            print("FAIL:", path)
+            for offset, expected, value in found:
+                diff = expected ^ value
+                bits = ", ".join(str(bit) for bit in range(8) if diff >> bit & 1)
+                print(
+                    f"  byte {offset:#x} ({offset}) bit {bits}: "
+                    f"{expected:#04x} → {value:#04x}"
+                )
+            if count > len(found):
+                print(f"  and {count - len(found)} more bytes")
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print(
+        f"Checked {len(paths)} files, {failed} failed, "
+        f"{total / 1e6:.0f} MB in {elapsed:.2f} s ({total / 1e6 / elapsed:.0f} MB/s)",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,11 +3,27 @@
 # requires-python = ">=3.12"
 # dependencies = [
 #   "cryptography>=46.0.3",
+#   "numpy>=2.0",
 # ]
 # ///
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
+import argparse
+import time
+import numpy as np
+from avalanche import flip_bits, hamming_distances, print_statistics
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--batch",
+    type=int,
+    default=0,
+    metavar="N",
+    help="also decrypt every single bit flip of the ciphertext, and N random blocks",
+)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
 
 # 16‑byte AES key (same as the encryption script)
 key: bytes = bytes.fromhex("00000000000000000000000000000000")
@@ -44,3 +60,27 @@ print("Plaintext:           ", plaintext.hex())
 # with bitflip
 print("Ciphertext (bitflip):", ciphertext_bitflip.hex())
 print("Plaintext (bitflip): ", plaintext_bitflip.hex())
+
+#########################################################
+# Avalanche statistics over many blocks with a bit flip #
+#########################################################
+
+if args.batch:
+    # one decryptor for every batch
+    decryptor = Cipher(
+        algorithms.AES(key), modes.ECB(), backend=default_backend()
+    ).decryptor()
+
+    start = time.perf_counter()
+    blocks = np.tile(np.frombuffer(ciphertext, dtype=np.uint8), (128, 1))
+    distances = hamming_distances(decryptor, blocks, flip_bits(blocks, np.arange(128)))
+    print_statistics(
+        "Every bit flip of the ciphertext", distances, time.perf_counter() - start
+    )
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+    blocks = rng.integers(0, 256, (args.batch, 16), dtype=np.uint8)
+    bits = rng.integers(0, 128, args.batch)
+    distances = hamming_distances(decryptor, blocks, flip_bits(blocks, bits))
+    print_statistics("Random ciphertexts", distances, time.perf_counter() - start)
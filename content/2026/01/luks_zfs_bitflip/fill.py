@@ -1,11 +1,169 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import ThreadPoolExecutor, wait
+import argparse
+import errno
+import mmap
+import os
+import random
+import sys
+import threading
+import time
+
 mib: int = 1024 * 1024
-aa: bytes = bytes([0b10101010]) * mib
-file_name: int = 1
-
-while True:
-    with open(f"/test/{file_name}", "wb") as f:
-        f.write(aa)
-    print(f"Created file {file_name}")
-    file_name += 1
+units: dict[str, int] = {"": 1, "K": 1024, "M": mib, "G": 1024 * mib, "T": mib * mib}
+
+
+def parse_size(value: str) -> int:
+    """Size in bytes from a number with an optional K, M, G or T suffix."""
+    value = value.upper().removesuffix("IB").removesuffix("B")
+    unit = value[-1:] if value[-1:] in units else ""
+    return int(float(value.removesuffix(unit)) * units[unit])
+
+
+def parse_pattern(value: str) -> str:
+    if value != "seeded" and len(bytes.fromhex(value)) != 1:
+        raise ValueError(value)
+    return value
+
+
+def pattern_block(pattern: str, seed: int, name: str) -> bytes:
+    """The MiB repeated through the file *name*.
+
+    A hex byte like ``aa``, or ``seeded`` for random bytes that differ between
+    files and are recomputed from the seed and the file name by check.py.
+    """
+    if pattern == "seeded":
+        return random.Random(f"{seed}:{name}").randbytes(mib)
+    return bytes.fromhex(pattern) * mib
+
+
+class Fill:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.lock = threading.Lock()
+        self.next_file = 1
+        # 0 to fill until the disk is full
+        self.files = -(-args.size // args.file_size) if args.size else 0
+        self.written = 0
+        self.full = False
+
+    def take(self) -> int | None:
+        """Number of the next file to write, None when done."""
+        with self.lock:
+            if self.full or (self.files and self.next_file > self.files):
+                return None
+            file_name = self.next_file
+            self.next_file += 1
+            return file_name
+
+    def file_size(self, file_name: int) -> int:
+        if self.files and file_name == self.files:
+            # the last file ends at the target size
+            return self.args.size - (self.files - 1) * self.args.file_size
+        return self.args.file_size
+
+    def write_file(self, file_name: int, buffer: mmap.mmap):
+        args = self.args
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        if args.direct:
+            flags |= os.O_DIRECT
+        if args.pattern == "seeded":
+            buffer[:] = pattern_block(args.pattern, args.seed, str(file_name))
+        block = memoryview(buffer)
+
+        fd = os.open(os.path.join(args.test_dir, str(file_name)), flags, 0o644)
+        try:
+            size = self.file_size(file_name)
+            done = 0
+            while done < size:
+                # continue the pattern after a short write
+                start = done % mib
+                n = os.write(fd, block[start : min(mib, start + size - done)])
+                done += n
+                with self.lock:
+                    self.written += n
+            if args.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def worker(self):
+        # one buffer per thread reused for every file, page aligned for O_DIRECT
+        buffer = mmap.mmap(-1, mib)
+        if self.args.pattern != "seeded":
+            buffer[:] = pattern_block(self.args.pattern, self.args.seed, "")
+        try:
+            while (file_name := self.take()) is not None:
+                try:
+                    self.write_file(file_name, buffer)
+                except OSError as e:
+                    if e.errno != errno.ENOSPC:
+                        raise
+                    with self.lock:
+                        self.full = True
+        finally:
+            buffer.close()
+
+    def run(self):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.threads) as executor:
+            futures = [executor.submit(self.worker) for _ in range(self.args.threads)]
+            while wait(futures, timeout=self.args.interval).not_done:
+                self.progress(start)
+            # re-raise the first failure
+            for future in futures:
+                future.result()
+        self.progress(start)
+        if self.full:
+            print("No space left on device", file=sys.stderr)
+
+    def progress(self, start: float):
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        with self.lock:
+            written = self.written
+            files = self.next_file - 1
+        print(
+            f"Created {files} files, {written / mib:.0f} MiB in {elapsed:.1f} s "
+            f"({written / 1e6 / elapsed:.0f} MB/s)",
+            file=sys.stderr,
+            flush=True,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fill a directory with files of a repeating pattern"
+    )
+    parser.add_argument("test_dir", nargs="?", default="/test")
+    parser.add_argument(
+        "--size",
+        type=parse_size,
+        default=0,
+        help="total size to write, like 10G, by default until the disk is full",
+    )
+    parser.add_argument("--file-size", type=parse_size, default=mib)
+    parser.add_argument(
+        "--pattern",
+        type=parse_pattern,
+        default="aa",
+        help="hex byte to repeat, or seeded (default: aa)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-j", "--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--direct", action="store_true", help="write with O_DIRECT")
+    parser.add_argument(
+        "--fsync", action="store_true", help="fsync every file after writing it"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=1, help="seconds between progress lines"
+    )
+    args = parser.parse_args()
+    if args.direct and (args.file_size % mmap.PAGESIZE or args.size % mmap.PAGESIZE):
+        parser.error(f"--direct needs sizes that are multiples of {mmap.PAGESIZE}")
+
+    Fill(args).run()
+
+
+if __name__ == "__main__":
+    main()
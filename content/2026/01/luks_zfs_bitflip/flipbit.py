@@ -1,20 +1,130 @@
 #!/usr/bin/env python3
 
-import os
+import argparse
+import json
+import mmap
+import random
+import sys
 
-image = "drive0.raw"
 
-size = os.path.getsize(image)
+def parse_flip(value: str) -> tuple[int, int]:
+    """Byte offset and bit from ``OFFSET`` or ``OFFSET:BIT``, bit 4 by default."""
+    offset, _, bit = value.partition(":")
+    return int(offset, 0), int(bit or "4", 0)
 
-byte_index = size // 2
-bit_index = 4
 
-with open(image, "r+b") as f:
-    f.seek(byte_index)
-    orig = f.read(1)[0]
-    flipped = orig ^ (1 << bit_index)
-    f.seek(byte_index)
-    f.write(bytes([flipped]))
+def random_flips(
+    size: int, count: int, seed: int, start: int, end: int
+) -> list[tuple[int, int]]:
+    """*count* flips at distinct offsets, uniform between *start* and *end*."""
+    rng = random.Random(seed)
+    offsets = sorted(rng.sample(range(start, end or size), count))
+    return [(offset, rng.randrange(8)) for offset in offsets]
 
-print(f"Bit {bit_index} of byte at offset {byte_index:#x} ({byte_index}) flipped")
-print(f"{orig:#02x} → {flipped:#02x} in '{image}'")
+
+def flip(m: mmap.mmap, flips: list[tuple[int, int]]) -> list[list[int]]:
+    """Flip every bit in place, returns offset, bit, old and new byte of each."""
+    changes = []
+    for byte_index, bit_index in flips:
+        orig = m[byte_index]
+        flipped = orig ^ (1 << bit_index)
+        m[byte_index] = flipped
+        changes.append([byte_index, bit_index, orig, flipped])
+    return changes
+
+
+def revert(m: mmap.mmap, changes: list[list[int]]):
+    """Restore the bytes changed by :func:`flip`, newest change first.
+
+    Nothing is written unless every byte still holds the value it was changed
+    to.
+    """
+    restored: dict[int, int] = {}
+    for byte_index, _, orig, flipped in reversed(changes):
+        current = restored.get(byte_index, m[byte_index])
+        if current != flipped:
+            sys.exit(
+                f"byte at offset {byte_index:#x} is {current:#04x}, "
+                f"expected {flipped:#04x}, not reverting"
+            )
+        restored[byte_index] = orig
+    for byte_index, orig in restored.items():
+        m[byte_index] = orig
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flip bits in a disk image")
+    parser.add_argument("image", nargs="?", default="drive0.raw")
+    parser.add_argument(
+        "--flip",
+        type=parse_flip,
+        action="append",
+        default=[],
+        metavar="OFFSET[:BIT]",
+        help="bit to flip, by default bit 4 of the byte in the middle",
+    )
+    parser.add_argument(
+        "--flips-file",
+        type=argparse.FileType(),
+        help="file with one OFFSET[:BIT] per line",
+    )
+    parser.add_argument(
+        "--random", type=int, default=0, metavar="N", help="flip N random bits"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", type=lambda v: int(v, 0), default=0)
+    parser.add_argument(
+        "--end", type=lambda v: int(v, 0), default=0, help="default: end of image"
+    )
+    parser.add_argument("--manifest", help="write the changed bytes to this file")
+    parser.add_argument(
+        "--revert",
+        type=argparse.FileType(),
+        metavar="MANIFEST",
+        help="restore the bytes changed by an earlier run",
+    )
+    args = parser.parse_args()
+
+    image = args.image
+
+    with open(image, "r+b") as f, mmap.mmap(f.fileno(), 0) as m:
+        size = len(m)
+
+        if args.revert:
+            manifest = json.load(args.revert)
+            revert(m, manifest["flips"])
+            m.flush()
+            print(f"Reverted {len(manifest['flips'])} flips in '{image}'")
+            return
+
+        flips = list(args.flip)
+        if args.flips_file:
+            flips += [parse_flip(line) for line in args.flips_file if line.strip()]
+        if args.random:
+            flips += random_flips(size, args.random, args.seed, args.start, args.end)
+        if not flips:
+            flips = [(size // 2, 4)]
+        # check all flips before changing anything
+        for byte_index, bit_index in flips:
+            if not 0 <= byte_index < size or not 0 <= bit_index < 8:
+                parser.error(f"no bit {bit_index} at offset {byte_index:#x}")
+
+        changes = flip(m, flips)
+        m.flush()
+
+    if args.manifest:
+        with open(args.manifest, "w") as f:
+            json.dump({"image": image, "flips": changes}, f)
+
+    if len(changes) > 10:
+        print(f"{len(changes)} bits flipped in '{image}'")
+        return
+    for byte_index, bit_index, orig, flipped in changes:
+        print(
+            f"Bit {bit_index} of byte at offset {byte_index:#x} ({byte_index}) flipped"
+        )
+        print(f"{orig:#02x} → {flipped:#02x} in '{image}'")
+
+
+if __name__ == "__main__":
+    main()
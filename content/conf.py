@@ -37,13 +37,17 @@ extensions = [
     "myst_parser",
     "sphinx.ext.intersphinx",
     "sphinx_blog",
+    "sphinx_compress",
     "sphinx_copybutton",
     "sphinx_favicon",
+    "sphinx_fingerprint",
+    "sphinx_images",
     "sphinx_sitemap",
     "sphinx_svgbob",
-    "sphinxcontrib.spelling",
     "sphinxext.rediraffe",
 ]
+# sphinxcontrib.spelling is loaded by "sphinx-build -b spelling" through its
+# builder entry point, other builders skip loading enchant
 
 nitpicky = True
 
@@ -113,6 +117,19 @@ sitemap_excludes = [
     "search/",
 ]
 
+###############################################################################
+# Blog
+###############################################################################
+
+# newest posts in atom.xml
+blog_feed_entries = 20
+
+# posts.json index and feed.json JSON Feed
+blog_json_feed = True
+
+# sharded search index instead of searchindex.js
+blog_search = True
+
 ###############################################################################
 # Spelling
 ###############################################################################
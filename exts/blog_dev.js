@@ -0,0 +1,31 @@
+// Dev mode of the blog, reloads the page when the last build wrote it.
+(() => {
+  const root = new URL(
+    document.documentElement.dataset.content_root,
+    window.location,
+  );
+  const page = decodeURIComponent(
+    window.location.pathname.slice(root.pathname.length),
+  );
+  const manifest = new URL("_dev/reload.json", root);
+  let build = null;
+
+  async function poll() {
+    try {
+      const response = await fetch(manifest, { cache: "no-store" });
+      if (response.ok) {
+        const { id, pages } = await response.json();
+        if (build !== null && id !== build && pages.includes(page)) {
+          window.location.reload();
+          return;
+        }
+        build = id;
+      }
+    } catch {
+      // the server is restarting
+    }
+    setTimeout(poll, 500);
+  }
+
+  poll();
+})();
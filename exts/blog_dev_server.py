@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Serve the blog and rebuild it in dev mode when the sources change.
+
+In dev mode an edit to a post only writes that post again, and only the
+browser tabs showing a written page reload.
+
+    ./exts/blog_dev_server.py --port 8000
+"""
+
+from typing import Dict, List
+import argparse
+import functools
+import http.server
+import os
+import subprocess
+import sys
+import threading
+import time
+
+repo_dir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Handler(http.server.SimpleHTTPRequestHandler):
+    def end_headers(self):
+        # pages change on every build
+        self.send_header("Cache-Control", "no-store")
+        super().end_headers()
+
+    def log_message(self, format: str, *args):
+        pass
+
+
+def snapshot(path: str) -> Dict[str, int]:
+    """Modified times of the files below *path*."""
+    mtimes = {}
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            try:
+                mtimes[file_path] = os.stat(file_path).st_mtime_ns
+            except FileNotFoundError:
+                # removed while walking
+                pass
+    return mtimes
+
+
+def build(args: argparse.Namespace):
+    cmd: List[str] = [
+        sys.executable,
+        "-m",
+        "sphinx",
+        "--quiet",
+        "--builder",
+        args.builder,
+        "--define",
+        "blog_dev_mode=1",
+    ]
+    for override in args.override:
+        cmd += ["--define", override]
+    cmd += [args.srcdir, args.outdir]
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd)
+    status = "built" if proc.returncode == 0 else "build failed"
+    print(f"{status} in {time.perf_counter() - start:.2f} s", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--srcdir", default=os.path.join(repo_dir, "content"))
+    parser.add_argument("--outdir", default=os.path.join(repo_dir, "build", "dev"))
+    parser.add_argument("--builder", default="dirhtml")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--interval", type=float, default=0.2, help="seconds between checks"
+    )
+    parser.add_argument(
+        "-D",
+        "--override",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="override a configuration value, like sphinx-build -D",
+    )
+    args = parser.parse_args()
+
+    mtimes = snapshot(args.srcdir)
+    build(args)
+
+    server = http.server.ThreadingHTTPServer(
+        (args.host, args.port), functools.partial(Handler, directory=args.outdir)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"serving on http://{args.host}:{args.port}/", flush=True)
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            current = snapshot(args.srcdir)
+            if current != mtimes:
+                mtimes = current
+                build(args)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
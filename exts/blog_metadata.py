@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Check the metadata of blog posts without building the site.
+
+Reads the ``{blogpost}`` directive and the top level heading straight from
+the Markdown sources, which is much faster than parsing them with MyST.
+
+    ./exts/blog_metadata.py content
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+import argparse
+import os
+import re
+import sys
+
+# opening fence of a blogpost directive, with the date as argument
+BLOGPOST = re.compile(r"^(`{3,}|:{3,})\{blogpost\}(.*)$")
+FENCE = re.compile(r"^(`{3,}|~{3,}|:{3,})")
+OPTION = re.compile(r"^:([\w-]+):(.*)$")
+
+OPTIONS = {"tags", "category", "updated", "title"}
+
+
+def split_list(a: str) -> List[str]:
+    return [s.strip() for s in (a or "").split(",")]
+
+
+def closes_fence(line: str, fence: str) -> bool:
+    """Whether *line* closes a block opened with *fence*: the same character
+    at least as many times, and nothing else."""
+    marker = line.strip()
+    return len(marker) >= len(fence) and marker == fence[0] * len(marker)
+
+
+def scan_post(path: str) -> Optional[Dict[str, Any]]:
+    """Raw metadata of the post at *path*, None if it is not a post.
+
+    Stops reading at the end of the blogpost directive once the title is
+    known.
+    """
+    title = None
+    directive = None
+    # closing marker of the blogpost directive while inside it
+    directive_fence = None
+    # opening marker of any other fenced block while inside it
+    fence = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+
+            if directive_fence is not None:
+                if closes_fence(line, directive_fence):
+                    directive_fence = None
+                    if title is not None:
+                        break
+                    continue
+                match = OPTION.match(line.strip())
+                if match:
+                    directive["options"][match.group(1)] = match.group(2).strip()
+                continue
+
+            # headings and directives inside code blocks are examples
+            if fence is not None:
+                if closes_fence(line, fence):
+                    fence = None
+                continue
+
+            match = BLOGPOST.match(line)
+            if match and directive is None:
+                directive_fence = match.group(1)
+                directive = {"date": match.group(2).strip(), "options": {}}
+                continue
+
+            match = FENCE.match(line)
+            if match:
+                fence = match.group(1)
+                continue
+
+            if title is None and line.startswith("# "):
+                title = line[2:].strip()
+                if directive is not None:
+                    break
+
+    if directive is None:
+        return None
+
+    options = directive["options"]
+    return {
+        "title": title,
+        "date": directive["date"] or None,
+        "tags": split_list(options["tags"]) if "tags" in options else [],
+        "category": split_list(options["category"]) if "category" in options else [],
+        "updated": options.get("updated"),
+        "options": sorted(options),
+    }
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def validate_post(post: Dict[str, Any]) -> List[str]:
+    """Problems with the metadata of a post, empty if there are none."""
+    errors = []
+    if not post["title"]:
+        errors.append("no top level heading")
+    for option in post["options"]:
+        if option not in OPTIONS:
+            errors.append(f"unknown option {option!r}")
+
+    date = None
+    if post["date"] is None:
+        errors.append("no date")
+    else:
+        try:
+            date = parse_date(post["date"])
+        except ValueError:
+            errors.append(f"invalid date {post['date']!r}, expected YYYY-MM-DD")
+
+    if post["updated"] is not None:
+        try:
+            updated = parse_date(post["updated"])
+        except ValueError:
+            errors.append(
+                f"invalid updated date {post['updated']!r}, expected YYYY-MM-DD"
+            )
+        else:
+            if date is not None and updated < date:
+                errors.append("updated before the post date")
+
+    for name in ["tags", "category"]:
+        values = post[name]
+        if any(not value for value in values):
+            errors.append(f"empty entry in {name}")
+        if len(set(values)) != len(values):
+            errors.append(f"duplicate entry in {name}")
+    return errors
+
+
+def find_sources(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith((".", "_")))
+            for filename in sorted(filenames):
+                if filename.endswith(".md"):
+                    yield os.path.join(dirpath, filename)
+
+
+def scan_posts(srcdir: str) -> Dict[str, Dict[str, Any]]:
+    """Raw metadata of all posts in *srcdir* by document name."""
+    posts = {}
+    for path in find_sources([srcdir]):
+        post = scan_post(path)
+        if post is not None:
+            docname = os.path.relpath(path, srcdir)[: -len(".md")]
+            posts[docname.replace(os.sep, "/")] = post
+    return posts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "paths", nargs="*", default=["content"], help="Markdown files or directories"
+    )
+    args = parser.parse_args()
+
+    posts = 0
+    failed = False
+    for path in find_sources(args.paths):
+        post = scan_post(path)
+        if post is None:
+            continue
+        posts += 1
+        for error in validate_post(post):
+            print(f"{path}: {error}", file=sys.stderr)
+            failed = True
+
+    print(f"checked {posts} posts")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
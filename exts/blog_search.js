@@ -0,0 +1,113 @@
+// Search page of the blog, fetches only the index shards of the query terms.
+(() => {
+  const script = document.currentScript;
+  const root = script.dataset.root;
+  const prefixLength = Number(script.dataset.prefixLength);
+  const stopwords = new Set(JSON.parse(script.dataset.stopwords));
+
+  const form = document.getElementById("blog-search-form");
+  const input = document.getElementById("blog-search-input");
+  const status = document.getElementById("blog-search-status");
+  const results = document.getElementById("blog-search-results");
+
+  const shards = new Map();
+  let posts = null;
+
+  // same as search_terms() in sphinx_blog.py
+  function searchTerms(text) {
+    const terms = text
+      .normalize("NFKD")
+      .replace(/[^\x00-\x7f]/g, "")
+      .toLowerCase()
+      .match(/[a-z0-9]+/g);
+    return (terms || []).filter(
+      (term) => term.length >= prefixLength && !stopwords.has(term),
+    );
+  }
+
+  async function fetchJson(path, fallback) {
+    const response = await fetch(root + path);
+    // a missing shard has no terms with that prefix
+    return response.ok ? response.json() : fallback;
+  }
+
+  function shard(prefix) {
+    if (!shards.has(prefix)) {
+      shards.set(prefix, fetchJson(`_search/${prefix}.json`, {}));
+    }
+    return shards.get(prefix);
+  }
+
+  async function search(query) {
+    const terms = [...new Set(searchTerms(query))];
+    if (!terms.length) {
+      return [];
+    }
+    posts ??= fetchJson("_search/posts.json", []);
+    const [index, ...found] = await Promise.all([
+      posts,
+      ...terms.map((term) => shard(term.slice(0, prefixLength))),
+    ]);
+
+    // every query term has to match, as a prefix of an indexed term
+    let scores = null;
+    terms.forEach((term, i) => {
+      const termScores = new Map();
+      for (const [indexTerm, postings] of Object.entries(found[i])) {
+        if (!indexTerm.startsWith(term)) {
+          continue;
+        }
+        for (const [post, weight] of postings) {
+          termScores.set(post, (termScores.get(post) || 0) + weight);
+        }
+      }
+      if (scores === null) {
+        scores = termScores;
+        return;
+      }
+      for (const [post, score] of scores) {
+        if (termScores.has(post)) {
+          scores.set(post, score + termScores.get(post));
+        } else {
+          scores.delete(post);
+        }
+      }
+    });
+
+    return [...scores]
+      .sort((a, b) => b[1] - a[1])
+      .map(([post]) => index[post]);
+  }
+
+  async function show(query) {
+    results.replaceChildren();
+    if (!query.trim()) {
+      status.textContent = "";
+      return;
+    }
+    status.textContent = "Searching...";
+    const found = await search(query);
+    status.textContent = found.length
+      ? `Found ${found.length} post${found.length === 1 ? "" : "s"}.`
+      : "No posts found.";
+    for (const [title, uri, date] of found) {
+      const item = document.createElement("li");
+      const link = document.createElement("a");
+      link.href = root + uri;
+      link.textContent = title;
+      item.append(link, ` (${date})`);
+      results.append(item);
+    }
+  }
+
+  form.addEventListener("submit", (event) => {
+    event.preventDefault();
+    const url = new URL(window.location);
+    url.searchParams.set("q", input.value);
+    window.history.replaceState(null, "", url);
+    show(input.value);
+  });
+
+  input.value = new URLSearchParams(window.location.search).get("q") || "";
+  show(input.value);
+})();
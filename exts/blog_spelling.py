@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Check the spelling of changed documents on all cores.
+
+Results are cached per document, keyed by the content of the document, the
+word list, the dictionary and the configuration. Only documents without a
+cached result are checked, in batches of documents with one Sphinx spelling
+build per process. Warnings of the build are reported like misspellings.
+
+    ./exts/blog_spelling.py content
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import runpy
+import shutil
+import sys
+import tempfile
+from blog_metadata import find_sources
+
+exts_dir: str = os.path.dirname(os.path.abspath(__file__))
+repo_dir: str = os.path.dirname(exts_dir)
+
+# bump when the format of cached results changes
+CACHE_VERSION = "2"
+
+# location prefix of the lines written by the spelling builder
+LOCATION = re.compile(r"^.*?:(\d+|None): ")
+# first line of a warning, followed by lines of its details
+WARNING = re.compile(r"\b(WARNING|ERROR|CRITICAL): ")
+# summary of the misspellings the builder writes, reported line by line
+MISSPELLED = re.compile(r"^WARNING: Found \d+ misspelled words$")
+
+# references to documents and images of other batches
+BATCH_WARNINGS: List[str] = [
+    "image.not_readable",
+    "myst.xref_missing",
+    "ref.doc",
+    "toc.not_readable",
+]
+
+
+def file_hash(path: str) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").digest()
+    except FileNotFoundError:
+        return b""
+
+
+def copied_files(srcdir: str, path: str) -> List[str]:
+    """Files :func:`copy_document` copies for the document at *path*."""
+    directory = os.path.dirname(path)
+    if os.path.samefile(directory, srcdir):
+        return [path]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        files += [os.path.join(dirpath, filename) for filename in sorted(filenames)]
+    return files
+
+
+def dictionary_hash(srcdir: str) -> bytes:
+    """Hash of the spell checker and the dictionary of the configured language."""
+    import enchant
+
+    config = runpy.run_path(os.path.join(srcdir, "conf.py"))
+    lang = config.get("spelling_lang", "en_US")
+
+    digest = hashlib.sha256()
+    parts = [enchant.__version__, enchant.get_enchant_version()]
+    parts += [
+        f"{provider.name}:{provider.file}"
+        for tag, provider in enchant.Broker().list_dicts()
+        if tag == lang
+    ]
+    for part in parts:
+        digest.update(part.encode("utf-8") + b"\0")
+    # hunspell finds its dictionaries through DICPATH, set by the flake
+    for directory in os.environ.get("DICPATH", "").split(os.pathsep):
+        if directory:
+            for suffix in [".aff", ".dic"]:
+                digest.update(file_hash(os.path.join(directory, lang + suffix)))
+    return digest.digest()
+
+
+def cache_key(srcdir: str, path: str, dictionary: bytes) -> str:
+    """Hash of a document and everything else deciding its misspellings.
+
+    Posts are checked with their whole directory, which holds the files they
+    include.
+    """
+    digest = hashlib.sha256(CACHE_VERSION.encode("utf-8"))
+    digest.update(dictionary)
+    digest.update(file_hash(os.path.join(srcdir, "conf.py")))
+    digest.update(file_hash(os.path.join(srcdir, "spelling_wordlist.txt")))
+    digest.update(os.path.relpath(path, srcdir).encode("utf-8"))
+    for file_path in copied_files(srcdir, path):
+        digest.update(os.path.relpath(file_path, srcdir).encode("utf-8") + b"\0")
+        digest.update(file_hash(file_path))
+    return digest.hexdigest()
+
+
+def docname(srcdir: str, path: str) -> str:
+    return os.path.relpath(path, srcdir)[: -len(".md")].replace(os.sep, "/")
+
+
+def copy_document(srcdir: str, path: str, dest: str):
+    """Copy a document with the files it includes to *dest*."""
+    directory = os.path.dirname(path)
+    if os.path.samefile(directory, srcdir):
+        shutil.copy(path, dest)
+        return
+    # posts keep their images and included files next to them
+    shutil.copytree(
+        directory,
+        os.path.join(dest, os.path.relpath(directory, srcdir)),
+        dirs_exist_ok=True,
+    )
+
+
+def split_warnings(output: str) -> List[str]:
+    """Warnings written by Sphinx, each with the lines of its details."""
+    from sphinx.util.console import strip_colors
+
+    records: List[str] = []
+    for line in strip_colors(output).splitlines(keepends=True):
+        if WARNING.search(line) or not records:
+            records.append(line)
+        else:
+            records[-1] += line
+    return [record for record in records if not MISSPELLED.match(record.strip())]
+
+
+def check_batch(srcdir: str, paths: List[str], cache_dir: str) -> Dict[str, List[str]]:
+    """Run the spelling builder over *paths*, misspellings and warnings by
+    path."""
+    from sphinx.application import Sphinx
+
+    with tempfile.TemporaryDirectory(prefix="blog-spelling-") as tmp:
+        # conf.py finds the local extensions relative to itself
+        os.symlink(exts_dir, os.path.join(tmp, "exts"))
+        tmp_srcdir = os.path.join(tmp, "content")
+        os.makedirs(tmp_srcdir)
+        for name in ["conf.py", "spelling_wordlist.txt"]:
+            if os.path.exists(os.path.join(srcdir, name)):
+                shutil.copy(os.path.join(srcdir, name), tmp_srcdir)
+        for path in paths:
+            copy_document(srcdir, path, tmp_srcdir)
+        root_doc = os.path.join(tmp_srcdir, "index.md")
+        if not os.path.exists(root_doc):
+            # Sphinx refuses to build without the root document
+            with open(root_doc, "w", encoding="utf-8") as f:
+                f.write("# Index\n")
+
+        outdir = os.path.join(tmp, "out")
+        warning = io.StringIO()
+        app = Sphinx(
+            srcdir=tmp_srcdir,
+            confdir=tmp_srcdir,
+            outdir=outdir,
+            doctreedir=os.path.join(tmp, "doctrees"),
+            buildername="spelling",
+            confoverrides={
+                # diagrams are shared between batches and runs
+                "svgbob_cache_dir": os.path.join(cache_dir, "svgbob"),
+                # images only need their size read, not encoding
+                "images_formats": [],
+                # only written by the HTML builders
+                "html_extra_path": [],
+                "html_static_path": [],
+                "suppress_warnings": BATCH_WARNINGS,
+            },
+            status=None,
+            warning=warning,
+        )
+        app.build()
+
+        # warnings are located in the files of a document, the others are
+        # reported with every document of the batch
+        results: Dict[str, List[str]] = {path: [] for path in paths}
+        for record in split_warnings(warning.getvalue()):
+            record = record.replace(
+                tmp_srcdir + os.sep, os.path.relpath(srcdir) + os.sep
+            )
+            located = [
+                path
+                for path in paths
+                if any(
+                    record.startswith(os.path.relpath(file_path) + ":")
+                    for file_path in copied_files(srcdir, path)
+                )
+            ]
+            for path in located or paths:
+                results[path].append(record)
+
+        for path in paths:
+            output = os.path.join(outdir, docname(srcdir, path) + ".spelling")
+            lines = []
+            if os.path.exists(output):
+                with open(output, encoding="utf-8") as f:
+                    for line in f:
+                        # report the source, not the temporary copy
+                        location = LOCATION.match(line)
+                        if location:
+                            line = (
+                                f"{os.path.relpath(path)}:{line[location.start(1) :]}"
+                            )
+                        lines.append(line)
+            results[path] = lines + results[path]
+        return results
+
+
+def read_cached(cache_dir: str, key: str) -> List[str]:
+    with open(os.path.join(cache_dir, key + ".json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_cached(cache_dir: str, key: str, lines: List[str]):
+    # write then rename so an interrupted run never leaves a partial result
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(lines, f)
+    os.replace(tmp_path, os.path.join(cache_dir, key + ".json"))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("srcdir", nargs="?", default=os.path.join(repo_dir, "content"))
+    parser.add_argument(
+        "--cache-dir",
+        default=os.path.join(repo_dir, ".cache", "spelling"),
+        help="directory of cached results, kept between runs",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    dictionary = dictionary_hash(args.srcdir)
+    keys = {}
+    results: Dict[str, List[str]] = {}
+    pending = []
+    for path in find_sources([args.srcdir]):
+        key = cache_key(args.srcdir, path, dictionary)
+        keys[path] = key
+        try:
+            results[path] = read_cached(args.cache_dir, key)
+        except FileNotFoundError:
+            pending.append(path)
+
+    print(
+        f"checking {len(pending)} of {len(keys)} documents", file=sys.stderr, flush=True
+    )
+    if pending:
+        jobs = max(1, min(args.jobs, len(pending)))
+        # one Sphinx start per process, not per document
+        batches = [pending[i::jobs] for i in range(jobs)]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(check_batch, args.srcdir, batch, args.cache_dir)
+                for batch in batches
+            ]
+            for future in futures:
+                for path, lines in future.result().items():
+                    write_cached(args.cache_dir, keys[path], lines)
+                    results[path] = lines
+
+    # warnings of a whole batch are repeated for each of its documents
+    findings = list(
+        dict.fromkeys(line for path in sorted(results) for line in results[path])
+    )
+    for line in findings:
+        sys.stdout.write(line)
+
+    if findings:
+        print(f"found {len(findings)} misspelled words and warnings", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,31 @@
+from docutils.parsers.rst import directives
 from sphinx.application import Sphinx
+from sphinx.config import Config
 from sphinx.util.docutils import SphinxDirective, nodes
 from sphinx.util.nodes import set_source_info
 from sphinx.addnodes import document
-from typing import Any, List, Dict
+from sphinx.environment import BuildEnvironment
+from sphinx.util.fileutil import copy_asset_file
+from sphinx.util.osutil import relative_uri
+from typing import TYPE_CHECKING, Any, BinaryIO, List, Dict, Optional, Set, Tuple
 from datetime import datetime
-from feedgen.feed import FeedGenerator
+from sphinx_timing import timed
+from blog_metadata import scan_posts, split_list
+import hashlib
+import heapq
+import html
+import json
+import math
 import os
-from dateutil import tz
 import posixpath
+import re
+import time
+import unicodedata
+import urllib.parse
 
-
-def _split(a: str) -> List[str]:
-    return [s.strip() for s in (a or "").split(",")]
+if TYPE_CHECKING:
+    # imports urllib and ssl, only needed when writing feeds
+    from xml.sax.saxutils import XMLGenerator
 
 
 class BlogPostNode(nodes.Element):
@@ -24,8 +38,8 @@ class BlogPostDirective(SphinxDirective):
     optional_arguments = 1
     final_argument_whitespace = True
     option_spec = {
-        "tags": _split,
-        "category": _split,
+        "tags": split_list,
+        "category": split_list,
         "updated": lambda a: a.strip(),
         "title": lambda a: a.strip(),
     }
@@ -52,15 +66,26 @@ class BlogRecentDirective(SphinxDirective):
     required_arguments = 0
     optional_arguments = 1
     final_argument_whitespace = True
-    option_spec = {}
+    option_spec = {
+        "limit": directives.positive_int,
+        "page-size": directives.positive_int,
+    }
 
     def run(self):
         node = BlogRecentNode()
         node.document = self.state.document
         set_source_info(self, node)
+        node["limit"] = self.options.get("limit", None)
+        node["page_size"] = self.options.get("page-size", None)
         return [node]
 
 
+class BlogRelatedNode(nodes.Element):
+    """Placeholder for the related posts, known once all posts are read."""
+
+    pass
+
+
 class BlogArchiveNode(nodes.Element):
     pass
 
@@ -103,7 +128,20 @@ def top_level_heading(node: nodes.Node, doctree: nodes.document) -> str:
     raise Exception("No top level heading found for the given node")
 
 
-def create_tag_reference(tag: str):
+def slug(name: str) -> str:
+    """Page name of a tag or year."""
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def create_tag_reference(tag: str, split_listings: bool):
+    if split_listings:
+        reference_node = nodes.reference(
+            refuri="/tags/" + slug(tag) + "/",
+            internal=True,
+        )
+        reference_node.append(nodes.Text(tag))
+        return reference_node
+
     ref_target = "tag-" + tag.lower()
     reference_node = nodes.reference(
         refuri="/tags/#" + ref_target,
@@ -116,10 +154,80 @@ def create_tag_reference(tag: str):
     return reference_node
 
 
-def process_blog_posts(app: Sphinx, doctree: document):
-    if not hasattr(app.builder.env, "blog_posts"):
-        app.builder.env.blog_posts = {}
+# common words matching most posts, left out of the search index
+SEARCH_STOPWORDS: Set[str] = {
+    "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "if",
+    "in", "into", "is", "it", "its", "of", "on", "or", "so", "than", "that",
+    "the", "then", "there", "these", "this", "to", "was", "we", "were", "will",
+    "with", "you", "your",
+}  # fmt: skip
+
+# index shards are split by this many leading characters of a term
+SEARCH_PREFIX_LENGTH = 2
+
+SEARCH_BODY_WEIGHT_MAX = 10
+SEARCH_TITLE_WEIGHT = 20
+SEARCH_TAG_WEIGHT = 10
+
+
+def search_terms(text: str) -> List[str]:
+    """Split text into search terms, the search page does the same."""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return [
+        term
+        for term in re.findall(r"[a-z0-9]+", text.lower())
+        if len(term) >= SEARCH_PREFIX_LENGTH and term not in SEARCH_STOPWORDS
+    ]
+
+
+def body_terms(doctree: document) -> Dict[str, int]:
+    """Count the prose terms of a post, code is not indexed."""
+    counts: Dict[str, int] = {}
+    for node in doctree.findall(nodes.Text):
+        if isinstance(node.parent, (nodes.literal_block, nodes.raw, nodes.comment)):
+            continue
+        for term in search_terms(node.astext()):
+            counts[term] = min(counts.get(term, 0) + 1, SEARCH_BODY_WEIGHT_MAX)
+    return counts
+
+
+def post_term_weights(
+    env: BuildEnvironment, docname: str, post_data: Dict[str, Any]
+) -> Dict[str, int]:
+    """Term weights of a post, boosted by its title and tags."""
+    weights = dict(env.blog_post_terms.get(docname, {}))
+    for term in search_terms(post_data["title"]):
+        weights[term] = weights.get(term, 0) + SEARCH_TITLE_WEIGHT
+    for tag in post_data["tags"]:
+        for term in search_terms(tag):
+            weights[term] = weights.get(term, 0) + SEARCH_TAG_WEIGHT
+    return weights
+
+
+def post_metadata(
+    app: Sphinx,
+    docname: str,
+    title: str,
+    tags: List[str],
+    category: List[str],
+    date: str,
+    updated: Optional[str],
+) -> Dict[str, Any]:
+    return {
+        "title": title,
+        "tags": tags,
+        "category": category,
+        "date": datetime.strptime(date, "%Y-%m-%d"),
+        "url": posixpath.join(
+            "https://thinglab.org",
+            app.builder.get_relative_uri(app.config.master_doc, docname),
+        ),
+        "updated": None if updated is None else datetime.strptime(updated, "%Y-%m-%d"),
+    }
 
+
+@timed
+def process_blog_posts(app: Sphinx, doctree: document):
     docname: str = app.builder.env.docname
 
     # silence "WARNING: document isn't included in any toctree"
@@ -128,21 +236,16 @@ def process_blog_posts(app: Sphinx, doctree: document):
     for node in doctree.findall(BlogPostNode):
         date_pretty = node["date"]
 
-        updated = None
-        if node["updated"] is not None:
-            updated = datetime.strptime(node["updated"], "%Y-%m-%d")
-
-        app.builder.env.blog_posts[docname] = {
-            "title": top_level_heading(node, doctree),
-            "tags": node["tags"],
-            "category": node["category"],
-            "date": datetime.strptime(date_pretty, "%Y-%m-%d"),
-            "url": posixpath.join(
-                "https://thinglab.org",
-                app.builder.get_relative_uri(app.config.master_doc, docname),
-            ),
-            "updated": updated,
-        }
+        app.builder.env.blog_posts[docname] = post_metadata(
+            app,
+            docname,
+            top_level_heading(node, doctree),
+            node["tags"],
+            node["category"],
+            date_pretty,
+            node["updated"],
+        )
+        app.builder.env.blog_post_terms[docname] = body_terms(doctree)
         blog_metadata = nodes.container()
         paragraph = nodes.paragraph()
         paragraph.append(nodes.Text("Date: " + date_pretty))
@@ -155,12 +258,167 @@ def process_blog_posts(app: Sphinx, doctree: document):
                 if not first:
                     paragraph.append(nodes.Text(", "))
                 first = False
-                paragraph.append(create_tag_reference(tag))
+                paragraph.append(
+                    create_tag_reference(tag, app.config.blog_split_listings)
+                )
             blog_metadata.append(paragraph)
+        blog_metadata.append(BlogRelatedNode())
         blog_metadata.append(nodes.transition())
         node.replace_self(blog_metadata)
 
 
+@timed
+def process_blog_listings(app: Sphinx, doctree: document):
+    """Note documents that list posts, they are rewritten when posts change."""
+    for node in doctree.findall(
+        lambda n: isinstance(n, (BlogRecentNode, BlogArchiveNode, BlogTagsNode))
+    ):
+        app.builder.env.blog_listings.add(app.builder.env.docname)
+        break
+
+
+def init_blog_env(app: Sphinx, env: BuildEnvironment, docnames: List[str]):
+    if not hasattr(env, "blog_posts"):
+        env.blog_posts = {}
+    if not hasattr(env, "blog_listings"):
+        env.blog_listings = set()
+    if not hasattr(env, "blog_posts_previous"):
+        env.blog_posts_previous = {}
+    if not hasattr(env, "blog_post_terms"):
+        env.blog_post_terms = {}
+    if not hasattr(env, "blog_post_terms_previous"):
+        env.blog_post_terms_previous = {}
+
+
+# metadata of the posts scanned from the sources in listings only mode
+_scanned_posts: Dict[str, Dict[str, Any]] = {}
+
+
+def exclude_blog_posts(app: Sphinx, config: Config):
+    """Only read and write the other pages in listings only mode, the post
+    metadata is scanned from the sources.
+
+    The posts are excluded by pattern, so Sphinx never finds them and later
+    builds do not see them as added.
+    """
+    _scanned_posts.clear()
+    if not config.blog_listings_only:
+        return
+    _scanned_posts.update(scan_posts(app.srcdir))
+    config.exclude_patterns = list(config.exclude_patterns) + [
+        docname + ".md" for docname in sorted(_scanned_posts)
+    ]
+    # redirects to posts point at pages that are not written
+    redirects = getattr(config, "rediraffe_redirects", None)
+    if isinstance(redirects, dict):
+        config.rediraffe_redirects = {
+            source: target
+            for source, target in redirects.items()
+            if target.removesuffix(".md") not in _scanned_posts
+            and posixpath.join(target, "index") not in _scanned_posts
+        }
+
+
+@timed
+def add_scanned_posts(app: Sphinx, env: BuildEnvironment):
+    """Replace the posts with the scanned metadata in listings only mode."""
+    if not app.config.blog_listings_only:
+        return
+    posts = {
+        docname: post_metadata(
+            app,
+            docname,
+            post["title"],
+            post["tags"],
+            post["category"],
+            post["date"],
+            post["updated"],
+        )
+        for docname, post in _scanned_posts.items()
+    }
+    for docname in env.blog_posts.keys() | posts.keys():
+        env.blog_posts_previous.setdefault(docname, env.blog_posts.get(docname))
+    env.blog_posts = posts
+
+
+def purge_blog_posts(app: Sphinx, env: BuildEnvironment, docname: str):
+    if not hasattr(env, "blog_posts"):
+        return
+    if not hasattr(env, "blog_posts_previous"):
+        env.blog_posts_previous = {}
+    # keep the metadata from before this build to detect changes after reading
+    post_data = env.blog_posts.pop(docname, None)
+    env.blog_posts_previous.setdefault(docname, post_data)
+    if hasattr(env, "blog_listings"):
+        env.blog_listings.discard(docname)
+    if hasattr(env, "blog_post_terms"):
+        if not hasattr(env, "blog_post_terms_previous"):
+            env.blog_post_terms_previous = {}
+        terms = env.blog_post_terms.pop(docname, None)
+        env.blog_post_terms_previous.setdefault(docname, terms)
+
+
+def merge_blog_posts(
+    app: Sphinx, env: BuildEnvironment, docnames: Set[str], other: BuildEnvironment
+):
+    """Merge blog posts read by a parallel reader process."""
+    if not hasattr(env, "blog_posts"):
+        env.blog_posts = {}
+    if not hasattr(env, "blog_listings"):
+        env.blog_listings = set()
+    if not hasattr(env, "blog_post_terms"):
+        env.blog_post_terms = {}
+    if not hasattr(other, "blog_posts"):
+        return
+    for docname in docnames:
+        if docname in other.blog_posts:
+            env.blog_posts[docname] = other.blog_posts[docname]
+            env.blog_post_terms[docname] = other.blog_post_terms[docname]
+        if docname in other.blog_listings:
+            env.blog_listings.add(docname)
+
+
+def outdated_blog_listings(
+    app: Sphinx,
+    env: BuildEnvironment,
+    added: Set[str],
+    changed: Set[str],
+    removed: Set[str],
+) -> List[str]:
+    """Reread pages listing posts when a post is removed."""
+    if not hasattr(env, "blog_posts") or not hasattr(env, "blog_listings"):
+        return []
+    if any(docname in env.blog_posts for docname in removed):
+        return sorted(env.blog_listings)
+    return []
+
+
+@timed
+def updated_blog_listings(app: Sphinx, env: BuildEnvironment) -> List[str]:
+    """Rewrite pages listing posts when post metadata changed.
+
+    Listings are resolved at write time from ``env.blog_posts``, so the pages
+    only need to be written again, not reread.
+    """
+    previous = env.blog_posts_previous
+    env.blog_posts_previous = {}
+    env.blog_metadata_changed = any(
+        env.blog_posts.get(docname) != post_data
+        for docname, post_data in previous.items()
+    )
+    if env.blog_metadata_changed:
+        return sorted(env.blog_listings)
+    return []
+
+
+def dev_skip(app: Sphinx, path: Optional[str] = None) -> bool:
+    """In dev mode, generated pages and files are only updated when post
+    metadata changed, or when *path* does not exist yet."""
+    if not app.config.blog_dev_mode or app.builder.env.blog_metadata_changed:
+        return False
+    return path is None or os.path.exists(path)
+
+
 def post_bullet_list_item(
     app: Sphinx, docname: str, post_docname: str, post_data: Dict[str, Any]
 ) -> nodes.list_item:
@@ -179,148 +437,888 @@ def post_bullet_list_item(
     return post
 
 
+@timed
+def build_blog_index(app: Sphinx, env: BuildEnvironment):
+    """Sort posts once after reading for the listings and the feed."""
+    posts = sorted(
+        env.blog_posts.items(),
+        key=lambda item: item[1]["date"],
+        reverse=True,
+    )
+
+    years: Dict[int, List[Tuple[str, Dict[str, Any]]]] = {}
+    tags: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    for post in posts:
+        post_data = post[1]
+        years.setdefault(post_data["date"].year, []).append(post)
+        for tag in post_data["tags"]:
+            tags.setdefault(tag, []).append(post)
+
+    env.blog_index = {
+        # newest first
+        "posts": posts,
+        "years": years,
+        "tags": tags,
+    }
+
+
+# terms kept per post, the vectors stay sparse at any post count
+RELATED_TERMS = 32
+# share of shared tags in the similarity, the rest is shared terms
+RELATED_TAG_SHARE = 0.5
+# postings kept per feature, highest weight and newest posts first, so tags
+# shared by many posts cost the same as rare ones
+RELATED_MAX_POSTINGS = 100
+
+
+def unit_vector(weights: Dict[str, float], length: float) -> Dict[str, float]:
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    if not norm:
+        return {}
+    return {feature: weight * length / norm for feature, weight in weights.items()}
+
+
+def related_vectors(
+    env: BuildEnvironment, posts: List[Tuple[str, Dict[str, Any]]]
+) -> Dict[str, Dict[str, float]]:
+    """Unit length vectors of posts, TF-IDF of terms and tags weighted apart.
+
+    The dot product of two vectors blends the cosine similarity of their
+    terms and of their tags by ``RELATED_TAG_SHARE``.
+    """
+    terms: Dict[str, Dict[str, int]] = {}
+    frequency: Dict[str, int] = {}
+    for docname, post_data in posts:
+        post_terms = post_term_weights(env, docname, post_data)
+        for tag in post_data["tags"]:
+            post_terms["tag:" + tag] = 1
+        for feature in post_terms:
+            frequency[feature] = frequency.get(feature, 0) + 1
+        terms[docname] = post_terms
+
+    vectors: Dict[str, Dict[str, float]] = {}
+    for docname, post_terms in terms.items():
+        term_weights: Dict[str, float] = {}
+        tag_weights: Dict[str, float] = {}
+        for feature, count in post_terms.items():
+            # features of every post say nothing about similarity
+            if frequency[feature] == len(posts):
+                continue
+            idf = math.log(len(posts) / frequency[feature])
+            if feature.startswith("tag:"):
+                tag_weights[feature] = idf
+            else:
+                term_weights[feature] = (1 + math.log(count)) * idf
+        top = heapq.nlargest(
+            RELATED_TERMS, term_weights.items(), key=lambda item: item[::-1]
+        )
+        vectors[docname] = {
+            **unit_vector(dict(top), math.sqrt(1 - RELATED_TAG_SHARE)),
+            **unit_vector(tag_weights, math.sqrt(RELATED_TAG_SHARE)),
+        }
+    return vectors
+
+
+@timed
+def build_related_posts(app: Sphinx, env: BuildEnvironment) -> List[str]:
+    """Find the most similar posts of every post.
+
+    Similarities are the product of the sparse post vectors with their
+    transpose, computed row by row through an inverted index, so a post is
+    only compared with posts sharing one of its features. Features of many
+    posts only keep their ``RELATED_MAX_POSTINGS`` heaviest postings.
+
+    Returns the posts whose related posts changed to write them again.
+    """
+    previous_terms = env.blog_post_terms_previous
+    env.blog_post_terms_previous = {}
+    limit = app.config.blog_related_posts
+    if not limit or app.config.blog_listings_only:
+        env.blog_related = {}
+        return []
+
+    # the similarities only change with the text and metadata of posts
+    if (
+        hasattr(env, "blog_related")
+        and getattr(env, "blog_related_limit", None) == limit
+        and not env.blog_metadata_changed
+        and all(
+            env.blog_post_terms.get(docname) == terms
+            for docname, terms in previous_terms.items()
+        )
+    ):
+        return []
+    previous = getattr(env, "blog_related", {})
+    env.blog_related = {}
+    env.blog_related_limit = limit
+
+    # only the edited post is written again in dev mode
+    changed_only = not dev_skip(app)
+
+    posts = env.blog_index["posts"]
+    vectors = related_vectors(env, posts)
+    postings: Dict[str, List[Tuple[str, float]]] = {}
+    for docname, vector in vectors.items():
+        for feature, weight in vector.items():
+            postings.setdefault(feature, []).append((docname, weight))
+    for feature, feature_postings in postings.items():
+        if len(feature_postings) > RELATED_MAX_POSTINGS:
+            # stable, posts are in newest first order
+            feature_postings.sort(key=lambda posting: posting[1], reverse=True)
+            del feature_postings[RELATED_MAX_POSTINGS:]
+
+    # newer posts first on equal similarity
+    order = {docname: position for position, (docname, _) in enumerate(posts)}
+    changed = []
+    for docname, vector in vectors.items():
+        scores: Dict[str, float] = {}
+        for feature, weight in vector.items():
+            for other, other_weight in postings[feature]:
+                scores[other] = scores.get(other, 0.0) + weight * other_weight
+        scores.pop(docname, None)
+        best = heapq.nlargest(
+            limit, scores, key=lambda other: (scores[other], -order[other])
+        )
+        # titles and dates are rendered, a change needs the post written again
+        related = [
+            (other, env.blog_posts[other]["title"], env.blog_posts[other]["date"])
+            for other in best
+        ]
+        env.blog_related[docname] = related
+        if changed_only and previous.get(docname) != related:
+            changed.append(docname)
+    return changed
+
+
+def post_bullet_list(
+    app: Sphinx, docname: str, posts: List[Tuple[str, Dict[str, Any]]]
+) -> nodes.bullet_list:
+    bullet_list = nodes.bullet_list()
+    for post_docname, post_data in posts:
+        bullet_list.append(post_bullet_list_item(app, docname, post_docname, post_data))
+    return bullet_list
+
+
+def paginate(
+    posts: List[Tuple[str, Dict[str, Any]]], page_size: int
+) -> List[List[Tuple[str, Dict[str, Any]]]]:
+    return [
+        posts[start : start + page_size]
+        for start in range(0, max(len(posts), 1), page_size)
+    ]
+
+
+def recent_page_name(docname: str, page: int) -> str:
+    """Page number *page* of the recent posts listed on *docname*."""
+    if page == 1:
+        return docname
+    return posixpath.join(docname, "page", str(page))
+
+
+def recent_pager(
+    app: Sphinx, pagename: str, docname: str, page: int, page_count: int
+) -> List[nodes.Node]:
+    """Links to the newer and older pages of recent posts."""
+    if page_count <= 1:
+        return []
+
+    paragraph = nodes.paragraph()
+    for text, target_page in [("Newer posts", page - 1), ("Older posts", page + 1)]:
+        if not 1 <= target_page <= page_count:
+            continue
+        if len(paragraph):
+            paragraph.append(nodes.Text(" | "))
+        ref = nodes.reference()
+        ref["refuri"] = app.builder.get_relative_uri(
+            from_=pagename, to=recent_page_name(docname, target_page)
+        )
+        ref.append(nodes.Text(text))
+        paragraph.append(ref)
+    return [paragraph]
+
+
+def listing_index(
+    app: Sphinx, docname: str, groups: Dict[Any, List[Tuple[str, Dict[str, Any]]]]
+) -> nodes.bullet_list:
+    """List of links to the per-year or per-tag pages of a listing."""
+    bullet_list = nodes.bullet_list()
+    for group, posts in groups.items():
+        ref = nodes.reference()
+        ref["refuri"] = app.builder.get_relative_uri(
+            from_=docname, to=posixpath.join(docname, slug(str(group)))
+        )
+        ref.append(nodes.Text(str(group)))
+
+        paragraph = nodes.paragraph()
+        paragraph.append(ref)
+        paragraph.append(nodes.Text(f" ({len(posts)})"))
+
+        item = nodes.list_item()
+        item.append(paragraph)
+        bullet_list.append(item)
+    return bullet_list
+
+
+@timed
 def process_blog_recent(app: Sphinx, doctree: document, docname: str):
     """Replace `BlogRecentNode` nodes with lists of posts."""
     for node in doctree.findall(BlogRecentNode):
-        recent_posts = nodes.bullet_list()
-        for post_docname, post_data in sorted(
-            app.builder.env.blog_posts.items(),
-            key=lambda item: item[1]["date"],
-            reverse=True,
-        ):
-            recent_post = post_bullet_list_item(app, docname, post_docname, post_data)
-            recent_posts.append(recent_post)
-        node.replace_self(recent_posts)
+        posts = app.builder.env.blog_index["posts"][: node["limit"]]
+        if not node["page_size"]:
+            node.replace_self(post_bullet_list(app, docname, posts))
+            continue
+
+        pages = paginate(posts, node["page_size"])
+        node.replace_self(
+            [post_bullet_list(app, docname, pages[0])]
+            + recent_pager(app, docname, docname, 1, len(pages))
+        )
 
 
+@timed
 def process_blog_archive(app: Sphinx, doctree: document, docname: str):
     """Replace `BlogArchiveNode` nodes with an archive."""
     for node in doctree.findall(BlogArchiveNode):
-        blog_archive = nodes.container()
-
-        year = None
-        year_list = None
-
-        for post_docname, post_data in sorted(
-            app.builder.env.blog_posts.items(),
-            key=lambda item: item[1]["date"],
-            reverse=True,
-        ):
-            post_date = post_data["date"]
-            post_year = post_date.year
-
-            if year != post_year:
-                if year_list is not None:
-                    year_section = nodes.section(ids=[f"year-{year}"])
-                    year_section.append(nodes.title(text=str(year)))
-                    year_section.append(year_list)
-                    blog_archive.append(year_section)
+        years = app.builder.env.blog_index["years"]
+        if app.config.blog_split_listings:
+            node.replace_self(listing_index(app, docname, years))
+            continue
 
-                year = post_year
-                year_list = nodes.bullet_list()
-
-            post_item = post_bullet_list_item(app, docname, post_docname, post_data)
-            year_list.append(post_item)
+        blog_archive = nodes.container()
 
-        year_section = nodes.section(ids=[f"year-{year}"])
-        year_section.append(nodes.title(text=str(year)))
-        year_section.append(year_list)
-        blog_archive.append(year_section)
+        for year, posts in years.items():
+            year_section = nodes.section(ids=[f"year-{year}"])
+            year_section.append(nodes.title(text=str(year)))
+            year_section.append(post_bullet_list(app, docname, posts))
+            blog_archive.append(year_section)
 
         node.replace_self(blog_archive)
 
 
+@timed
 def process_blog_tags(app: Sphinx, doctree: document, docname: str):
     """Replace `BlogTagsNode` nodes with tags."""
     for node in doctree.findall(BlogTagsNode):
-        blog_tags = nodes.container()
+        tags = app.builder.env.blog_index["tags"]
+        if app.config.blog_split_listings:
+            node.replace_self(listing_index(app, docname, tags))
+            continue
 
-        tags = {}
-
-        for post_docname, post_data in sorted(
-            app.builder.env.blog_posts.items(),
-            key=lambda item: item[1]["date"],
-            reverse=True,
-        ):
-            for tag in post_data["tags"]:
-                if tag not in tags:
-                    tags[tag] = []
-                tags[tag].append(
-                    post_bullet_list_item(app, docname, post_docname, post_data)
-                )
+        blog_tags = nodes.container()
 
-        for tag, tagged_posts in tags.items():
+        for tag, posts in tags.items():
             tag_section = nodes.section(ids=[f"tag-{tag.lower()}"])
             tag_section.append(nodes.title(text=str(tag)))
-            tag_list = nodes.bullet_list()
-            for item in tagged_posts:
-                tag_list.append(item)
-            tag_section.append(tag_list)
+            tag_section.append(post_bullet_list(app, docname, posts))
             blog_tags.append(tag_section)
 
         node.replace_self(blog_tags)
 
 
-def create_feed(app: Sphinx):
-    feed = FeedGenerator()
-    feed.id("https://thinglab.org")
-    feed.title("ThingLab Blog")
-    feed.author({"name": "Alex Martens"})
-    feed.subtitle(
-        "Alex Martens' blog. A mix of software, firmware, and hardware projects."
+@timed
+def process_blog_related(app: Sphinx, doctree: document, docname: str):
+    """Replace `BlogRelatedNode` placeholders with lists of similar posts."""
+    env = app.builder.env
+    for node in list(doctree.findall(BlogRelatedNode)):
+        related = env.blog_related.get(docname)
+        if not related:
+            node.parent.remove(node)
+            continue
+        paragraph = nodes.paragraph()
+        paragraph.append(nodes.Text("Related posts:"))
+        posts = [(other, env.blog_posts[other]) for other, _, _ in related]
+        node.replace_self([paragraph, post_bullet_list(app, docname, posts)])
+
+
+def render_fragment(app: Sphinx, pagename: str, node: nodes.Node) -> str:
+    """HTML of *node* as part of the page *pagename*.
+
+    The builder only sets up the state of a page when writing it, after
+    ``doctree-resolved`` and never for generated pages.
+    """
+    builder = app.builder
+    builder.secnumbers = builder.env.toc_secnumbers.get(pagename, {})
+    builder.fignumbers = builder.env.toc_fignumbers.get(pagename, {})
+    builder.imgpath = relative_uri(builder.get_target_uri(pagename), builder.imagedir)
+    builder.post_process_images(node)
+    return builder.render_partial(node)["fragment"]
+
+
+def listing_page(
+    app: Sphinx, pagename: str, title: str, body: List[nodes.Node]
+) -> Tuple[str, Dict[str, Any], str]:
+    section = nodes.section(ids=[nodes.make_id(title)])
+    section.append(nodes.title(text=title))
+    section.extend(body)
+    context = {
+        "title": title,
+        "body": render_fragment(app, pagename, section),
+    }
+    return (pagename, context, "page.html")
+
+
+# pages generated from the listings resolved by this build
+_listing_pages: List[Tuple[str, Dict[str, Any], str]] = []
+
+
+@timed
+def resolve_listing_pages(app: Sphinx, doctree: document, docname: str):
+    """Render the recent posts pages after the first, and the per-year and
+    per-tag pages when listings are split.
+
+    The pages only change with the listing they belong to, which is written
+    again when post metadata changes.
+    """
+    env = app.builder.env
+    if app.builder.format != "html" or docname not in env.blog_listings:
+        return
+    index = env.blog_index
+    title = env.titles[docname].astext()
+
+    for node in doctree.findall(BlogRecentNode):
+        if not node["page_size"]:
+            continue
+        pages = paginate(index["posts"][: node["limit"]], node["page_size"])
+        for page in range(2, len(pages) + 1):
+            pagename = recent_page_name(docname, page)
+            _listing_pages.append(
+                listing_page(
+                    app,
+                    pagename,
+                    f"{title}, page {page}",
+                    [post_bullet_list(app, pagename, pages[page - 1])]
+                    + recent_pager(app, pagename, docname, page, len(pages)),
+                )
+            )
+
+    if not app.config.blog_split_listings:
+        return
+
+    groups = {}
+    for node in doctree.findall(BlogArchiveNode):
+        groups.update(index["years"])
+    for node in doctree.findall(BlogTagsNode):
+        groups.update(index["tags"])
+    for group, posts in groups.items():
+        pagename = posixpath.join(docname, slug(str(group)))
+        _listing_pages.append(
+            listing_page(
+                app,
+                pagename,
+                f"{title}: {group}",
+                [post_bullet_list(app, pagename, posts)],
+            )
+        )
+
+
+def collect_listing_pages(app: Sphinx):
+    yield from _listing_pages
+    _listing_pages.clear()
+
+
+def xml_element(
+    xml: "XMLGenerator", name: str, text: str = "", attrs: Dict[str, str] = {}
+):
+    xml.startElement(name, attrs)
+    xml.characters(text)
+    xml.endElement(name)
+
+
+class DigestWriter:
+    """Binary writer hashing everything written through it."""
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return self.f.write(data)
+
+
+def file_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+# attributes of HTML tags that hold URLs
+URL_ATTRIBUTE = re.compile(r'\b(href|src|srcset)="([^"]*)"')
+
+
+def absolute_urls(fragment: str, base: str) -> str:
+    """*fragment* with URLs relative to *base* made absolute, feed readers
+    show it away from the page."""
+
+    def replace(match: re.Match) -> str:
+        attribute, value = match.groups()
+        if attribute == "srcset":
+            candidates = []
+            for candidate in value.split(","):
+                url, _, descriptor = candidate.strip().partition(" ")
+                url = urllib.parse.urljoin(base, url)
+                candidates.append(f"{url} {descriptor}" if descriptor else url)
+            value = ", ".join(candidates)
+        else:
+            value = urllib.parse.urljoin(base, value)
+        return f'{attribute}="{value}"'
+
+    return URL_ATTRIBUTE.sub(replace, fragment)
+
+
+def post_html_path(app: Sphinx) -> str:
+    """Feed content of the posts, kept between builds.
+
+    The environment is pickled before the documents are written, so this is
+    kept next to it.
+    """
+    return os.path.join(app.doctreedir, "blog_post_html.json")
+
+
+# feed content by document name, of the posts written by this and earlier
+# builds
+_post_html: Dict[str, str] = {}
+
+
+def load_post_html(app: Sphinx):
+    _post_html.clear()
+    try:
+        with open(post_html_path(app), encoding="utf-8") as f:
+            _post_html.update(json.load(f))
+    except FileNotFoundError:
+        pass
+
+
+@timed
+def capture_post_html(app: Sphinx, doctree: document, docname: str):
+    """Render the body of a post for the feeds once, while it is written."""
+    env = app.builder.env
+    if (
+        not app.config.blog_feed_content
+        or app.builder.format != "html"
+        or docname not in env.blog_posts
+    ):
+        return
+    section = doctree.next_node(nodes.section)
+    body = nodes.container()
+    for child in section.children:
+        if not isinstance(child, nodes.title):
+            body.append(child.deepcopy())
+    fragment = render_fragment(app, docname, body)
+    _post_html[docname] = absolute_urls(fragment, env.blog_posts[docname]["url"])
+
+
+def save_post_html(app: Sphinx, exception: Optional[Exception]):
+    if (
+        exception is not None
+        or not app.config.blog_feed_content
+        or app.builder.format != "html"
+    ):
+        return
+    posts = app.builder.env.blog_posts
+    write_if_changed(
+        post_html_path(app),
+        json_bytes(
+            {
+                docname: body
+                for docname, body in sorted(_post_html.items())
+                if docname in posts
+            }
+        ),
     )
-    feed.copyright(app.builder.env.config.copyright)
-    feed.language("en")
-    feed.link(href="https://thinglab.org")
-    feed.link(href="https://thinglab.org/atom.xml", rel="self")
+
+
+def post_content(app: Sphinx, docname: str) -> str:
+    """Rendered HTML of a post without its top level heading."""
+    if docname not in _post_html:
+        # not written since the cache was lost, resolving it renders it
+        app.builder.env.get_and_resolve_doctree(docname, app.builder)
+    return _post_html[docname]
+
+
+def write_feed(
+    app: Sphinx,
+    out_path: str,
+    feed_url: str,
+    title: str,
+    posts: List[Tuple[str, Dict[str, Any]]],
+):
+    """Write an Atom feed of *posts* entry by entry.
+
+    The feed is only replaced when its content changed, to keep the modified
+    time for conditional requests. A ``.sha256`` sidecar holds the digest.
+    """
+    from dateutil import tz
+    from xml.sax.saxutils import XMLGenerator
+
+    timezone = tz.gettz("America/Vancouver")
+    # 0 for all posts
+    posts = posts[: app.config.blog_feed_entries or None]
 
     newest_date = None
+    for _, post_data in posts:
+        for date in [post_data["date"], post_data["updated"]]:
+            if date is not None and (newest_date is None or date > newest_date):
+                newest_date = date
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        writer = DigestWriter(f)
+        xml = XMLGenerator(writer, "utf-8", short_empty_elements=True)
+        xml.startDocument()
+        xml.startElement(
+            "feed", {"xmlns": "http://www.w3.org/2005/Atom", "xml:lang": "en"}
+        )
+        xml_element(xml, "id", "https://thinglab.org")
+        xml_element(xml, "title", title)
+        if newest_date is not None:
+            xml_element(
+                xml, "updated", newest_date.replace(tzinfo=timezone).isoformat()
+            )
+        xml.startElement("author", {})
+        xml_element(xml, "name", "Alex Martens")
+        xml.endElement("author")
+        xml_element(xml, "link", attrs={"href": "https://thinglab.org"})
+        xml_element(xml, "link", attrs={"href": feed_url, "rel": "self"})
+        xml_element(xml, "rights", app.config.copyright)
+        xml_element(
+            xml,
+            "subtitle",
+            "Alex Martens' blog. A mix of software, firmware, and hardware projects.",
+        )
+
+        for post_docname, post_data in posts:
+            published = post_data["date"].replace(tzinfo=timezone)
+            updated = published
+            if post_data["updated"] is not None:
+                updated = post_data["updated"].replace(tzinfo=timezone)
+
+            xml.startElement("entry", {})
+            xml_element(xml, "id", post_data["url"])
+            xml_element(xml, "title", post_data["title"])
+            xml_element(xml, "updated", updated.isoformat())
+            xml_element(xml, "link", attrs={"href": post_data["url"]})
+            xml_element(xml, "published", published.isoformat())
+            # posts are not read in listings only mode
+            if app.config.blog_feed_content and not app.config.blog_listings_only:
+                xml_element(
+                    xml,
+                    "content",
+                    post_content(app, post_docname),
+                    # resolve relative links in the content against the post
+                    {"type": "html", "xml:base": post_data["url"]},
+                )
+            xml.endElement("entry")
+
+        xml.endElement("feed")
+        xml.endDocument()
+
+    digest = writer.digest.hexdigest()
+    if file_digest(out_path) == digest:
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, out_path)
+
+    sidecar = f"{digest}  {os.path.basename(out_path)}\n"
+    sidecar_path = out_path + ".sha256"
+    try:
+        with open(sidecar_path, encoding="utf-8") as f:
+            if f.read() == sidecar:
+                return
+    except FileNotFoundError:
+        pass
+    with open(sidecar_path, "w", encoding="utf-8") as f:
+        f.write(sidecar)
+
+
+@timed
+def create_feed(app: Sphinx):
+    if dev_skip(app, os.path.join(app.builder.outdir, "atom.xml")):
+        return
+    index = app.builder.env.blog_index
+
+    write_feed(
+        app,
+        os.path.join(app.builder.outdir, "atom.xml"),
+        "https://thinglab.org/atom.xml",
+        "ThingLab Blog",
+        index["posts"],
+    )
 
-    for post_docname, post_data in sorted(
-        app.builder.env.blog_posts.items(),
-        key=lambda item: item[1]["date"],
-    ):
-        feed_entry = feed.add_entry()
-        feed_entry.id(post_data["url"])
-        feed_entry.link(href=post_data["url"])
-        feed_entry.title(post_data["title"])
-        published = post_data["date"].replace(tzinfo=tz.gettz("America/Vancouver"))
-        feed_entry.published(published)
-        if newest_date is None:
-            newest_date = published
-        if published > newest_date:
-            newest_date = published
-        if post_data["updated"] is not None:
-            updated = post_data["updated"].replace(tzinfo=tz.gettz("America/Vancouver"))
-            print(f"set updated for {post_docname} to {updated}")
-            if updated > newest_date:
-                newest_date = updated
-            feed_entry.updated(updated)
-        else:
-            feed_entry.updated(published)
+    if app.config.blog_feed_tags:
+        for tag, posts in index["tags"].items():
+            feed_path = posixpath.join("tags", slug(tag), "atom.xml")
+            write_feed(
+                app,
+                os.path.join(app.builder.outdir, feed_path),
+                posixpath.join("https://thinglab.org", feed_path),
+                f"ThingLab Blog: {tag}",
+                posts,
+            )
+
+    if 0:
+        yield
 
-    feed.updated(newest_date)
 
-    out_path = os.path.join(app.builder.outdir, "atom.xml")
-    feed.atom_file(out_path)
+def json_bytes(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@timed
+def create_json_feed(app: Sphinx):
+    """Write ``posts.json``, an index of all posts, and ``feed.json``, a JSON
+    Feed of the newest posts."""
+    if not app.config.blog_json_feed or dev_skip(
+        app, os.path.join(app.builder.outdir, "feed.json")
+    ):
+        return
+    from dateutil import tz
+
+    timezone = tz.gettz("America/Vancouver")
+    posts = app.builder.env.blog_index["posts"]
+
+    index = []
+    for _, post_data in posts:
+        updated = post_data["updated"]
+        index.append(
+            {
+                "title": post_data["title"],
+                "url": post_data["url"],
+                "date": post_data["date"].strftime("%Y-%m-%d"),
+                "updated": None if updated is None else updated.strftime("%Y-%m-%d"),
+                "tags": post_data["tags"],
+            }
+        )
+    write_if_changed(os.path.join(app.builder.outdir, "posts.json"), json_bytes(index))
+
+    items = []
+    # 0 for all posts
+    for post_docname, post_data in posts[: app.config.blog_feed_entries or None]:
+        item = {
+            "id": post_data["url"],
+            "url": post_data["url"],
+            "title": post_data["title"],
+            "date_published": post_data["date"].replace(tzinfo=timezone).isoformat(),
+        }
+        if post_data["updated"] is not None:
+            item["date_modified"] = (
+                post_data["updated"].replace(tzinfo=timezone).isoformat()
+            )
+        if post_data["tags"]:
+            item["tags"] = post_data["tags"]
+        # posts are not read in listings only mode, without content readers
+        # link to the post
+        if app.config.blog_feed_content and not app.config.blog_listings_only:
+            item["content_html"] = post_content(app, post_docname)
+        items.append(item)
+
+    feed = {
+        "version": "https://jsonfeed.org/version/1.1",
+        "title": "ThingLab Blog",
+        "home_page_url": "https://thinglab.org",
+        "feed_url": "https://thinglab.org/feed.json",
+        "description": (
+            "Alex Martens' blog. A mix of software, firmware, and hardware projects."
+        ),
+        "authors": [{"name": "Alex Martens", "url": "https://thinglab.org"}],
+        "language": "en",
+        "items": items,
+    }
+    write_if_changed(os.path.join(app.builder.outdir, "feed.json"), json_bytes(feed))
 
     if 0:
         yield
 
 
+def write_if_changed(path: str, data: bytes) -> bool:
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def disable_sphinx_search(app: Sphinx):
+    """Replace the search index of Sphinx with the sharded blog index."""
+    if app.config.blog_search and getattr(app.builder, "search", False):
+        app.builder.search = False
+
+
+@timed
+def create_search_index(app: Sphinx):
+    """Write an inverted index of posts split into shards by term prefix, and
+    the search page fetching the shards of the query terms."""
+    if (
+        not app.config.blog_search
+        or app.config.blog_listings_only
+        or app.builder.format != "html"
+        or dev_skip(app, os.path.join(app.builder.outdir, "_search", "posts.json"))
+    ):
+        return
+
+    env = app.builder.env
+    posts = env.blog_index["posts"]
+
+    shards: Dict[str, Dict[str, List[List[int]]]] = {}
+    for post_id, (docname, post_data) in enumerate(posts):
+        weights = post_term_weights(env, docname, post_data)
+        for term, weight in weights.items():
+            shard = shards.setdefault(term[:SEARCH_PREFIX_LENGTH], {})
+            shard.setdefault(term, []).append([post_id, weight])
+
+    out_dir = os.path.join(app.builder.outdir, "_search")
+    os.makedirs(out_dir, exist_ok=True)
+    files = {"posts.json"}
+    index = [
+        [
+            post_data["title"],
+            app.builder.get_target_uri(docname),
+            post_data["date"].strftime("%Y-%m-%d"),
+        ]
+        for docname, post_data in posts
+    ]
+    write_if_changed(
+        os.path.join(out_dir, "posts.json"),
+        json.dumps(index, separators=(",", ":")).encode("utf-8"),
+    )
+    for prefix, shard in shards.items():
+        for postings in shard.values():
+            postings.sort(key=lambda posting: posting[1], reverse=True)
+        files.add(prefix + ".json")
+        write_if_changed(
+            os.path.join(out_dir, prefix + ".json"),
+            json.dumps(shard, separators=(",", ":"), sort_keys=True).encode("utf-8"),
+        )
+    # shards of terms no longer in any post
+    for entry in os.scandir(out_dir):
+        if entry.name not in files:
+            os.remove(entry.path)
+
+    copy_asset_file(
+        os.path.join(os.path.dirname(__file__), "blog_search.js"),
+        os.path.join(app.builder.outdir, "_static"),
+    )
+
+    page_uri = app.builder.get_target_uri("search")
+    script = relative_uri(page_uri, "_static/blog_search.js")
+    root = relative_uri(page_uri, "_search/")[: -len("_search/")]
+    stopwords = json.dumps(sorted(SEARCH_STOPWORDS))
+    body = f"""<section id="search">
+<h1>Search</h1>
+<form id="blog-search-form" method="get" role="search">
+<input id="blog-search-input" type="search" name="q" aria-label="Search">
+<button type="submit">Search</button>
+</form>
+<p id="blog-search-status"></p>
+<ul id="blog-search-results"></ul>
+<script src="{html.escape(script)}" data-root="{html.escape(root)}"
+  data-prefix-length="{SEARCH_PREFIX_LENGTH}"
+  data-stopwords="{html.escape(stopwords)}"></script>
+</section>
+"""
+    yield ("search", {"title": "Search", "body": body}, "page.html")
+
+
+# target URIs of the pages written by this build, reloaded in dev mode
+_dev_written: List[str] = []
+
+
+def init_dev_mode(app: Sphinx):
+    if app.config.blog_dev_mode and app.builder.format == "html":
+        app.add_js_file("blog_dev.js")
+
+
+def note_written_page(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Optional[nodes.document],
+):
+    if app.config.blog_dev_mode:
+        _dev_written.append(app.builder.get_target_uri(pagename))
+
+
+def write_dev_reload(app: Sphinx, exception: Optional[Exception]):
+    """List the pages written by this build for open pages to reload."""
+    if (
+        not app.config.blog_dev_mode
+        or exception is not None
+        or app.builder.format != "html"
+    ):
+        return
+
+    copy_asset_file(
+        os.path.join(os.path.dirname(__file__), "blog_dev.js"),
+        os.path.join(app.builder.outdir, "_static"),
+    )
+    path = os.path.join(app.builder.outdir, "_dev")
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "reload.json"), "w", encoding="utf-8") as f:
+        json.dump({"id": time.time_ns(), "pages": sorted(set(_dev_written))}, f)
+    _dev_written.clear()
+
+
 def setup(app: Sphinx) -> Dict[str, Any]:
+    app.setup_extension("sphinx_timing")
+    app.add_config_value("blog_split_listings", False, "env", types=[bool])
+    app.add_config_value("blog_feed_entries", 0, "html", types=[int])
+    app.add_config_value("blog_feed_content", False, "html", types=[bool])
+    app.add_config_value("blog_feed_tags", False, "html", types=[bool])
+    app.add_config_value("blog_json_feed", False, "html", types=[bool])
+    app.add_config_value("blog_search", False, "html", types=[bool])
+    # build only the listings and the feed, from post metadata scanned from the
+    # sources, for a quick preview
+    app.add_config_value("blog_listings_only", False, "env", types=[bool])
+    # for previews, only the edited pages are written and reloaded, generated
+    # files are only updated when post metadata changed
+    app.add_config_value("blog_dev_mode", False, "html", types=[bool])
+    # similar posts listed under the metadata of a post, 0 for none
+    app.add_config_value("blog_related_posts", 3, "html", types=[int])
     app.add_directive("blogpost", BlogPostDirective)
     app.add_directive("blogrecent", BlogRecentDirective)
     app.add_directive("blogarchive", BlogArchiveDirective)
     app.add_directive("blogtags", BlogTagsDirective)
+    app.connect("config-inited", exclude_blog_posts)
+    app.connect("builder-inited", disable_sphinx_search)
+    app.connect("builder-inited", init_dev_mode)
+    app.connect("builder-inited", load_post_html)
+    app.connect("env-before-read-docs", init_blog_env)
     app.connect("doctree-read", process_blog_posts)
+    app.connect("doctree-read", process_blog_listings)
+    app.connect("env-purge-doc", purge_blog_posts)
+    app.connect("env-merge-info", merge_blog_posts)
+    app.connect("env-get-outdated", outdated_blog_listings)
+    app.connect("env-updated", add_scanned_posts, priority=400)
+    app.connect("env-updated", updated_blog_listings)
+    app.connect("env-updated", build_blog_index)
+    app.connect("env-updated", build_related_posts)
+    # before the listing nodes are replaced
+    app.connect("doctree-resolved", resolve_listing_pages)
     app.connect("doctree-resolved", process_blog_recent)
     app.connect("doctree-resolved", process_blog_archive)
     app.connect("doctree-resolved", process_blog_tags)
+    app.connect("doctree-resolved", process_blog_related)
+    # after the other extensions replaced their nodes
+    app.connect("doctree-resolved", capture_post_html, priority=900)
+    app.connect("html-collect-pages", collect_listing_pages)
     app.connect("html-collect-pages", create_feed)
+    app.connect("html-collect-pages", create_json_feed)
+    app.connect("html-collect-pages", create_search_index)
+    app.connect("html-page-context", note_written_page)
+    app.connect("build-finished", write_dev_reload)
+    app.connect("build-finished", save_post_html)
 
     return {
         "version": "1.0.0",
-        "parallel_read_safe": False,
+        "env_version": 2,
+        "parallel_read_safe": True,
         "parallel_write_safe": True,
     }
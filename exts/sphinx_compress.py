@@ -0,0 +1,159 @@
+"""Precompressed output files for static serving"""
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from sphinx_timing import timed
+
+logger = logging.getLogger(__name__)
+
+
+def brotli_compress(data: bytes) -> bytes:
+    import brotli
+
+    return brotli.compress(data, quality=11)
+
+
+def zstd_compress(data: bytes) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+# slowest settings, files are compressed once and served many times
+ENCODERS = {
+    "gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+    "br": brotli_compress,
+    "zst": zstd_compress,
+}
+
+
+def cache_path(app: Sphinx) -> str:
+    """Content hashes of the files compressed by the last build."""
+    return os.path.join(app.doctreedir, "compress.json")
+
+
+def read_cache(app: Sphinx) -> Dict[str, str]:
+    try:
+        with open(cache_path(app), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def compressible(app: Sphinx) -> List[str]:
+    """Output files worth compressing, relative to the output directory."""
+    suffixes = tuple(app.config.compress_suffixes)
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(app.builder.outdir):
+        # .doctrees and other build state
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if (
+                filename.endswith(suffixes)
+                and os.path.getsize(path) >= app.config.compress_min_size
+            ):
+                paths.append(os.path.relpath(path, app.builder.outdir))
+    return paths
+
+
+def file_key(path: str, formats: List[str]) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(hashlib.file_digest(f, "sha256").digest())
+    digest.update(json.dumps(formats).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def remove_siblings(path: str, formats: List[str]):
+    for fmt in formats:
+        try:
+            os.remove(f"{path}.{fmt}")
+        except FileNotFoundError:
+            pass
+
+
+def compress(path: str, formats: List[str]):
+    """Write a compressed sibling of *path* for every format."""
+    with open(path, "rb") as f:
+        data = f.read()
+    stat = os.stat(path)
+    remove_siblings(path, [fmt for fmt in ENCODERS if fmt not in formats])
+
+    for fmt in formats:
+        out_path = f"{path}.{fmt}"
+        compressed = ENCODERS[fmt](data)
+        if len(compressed) >= len(data):
+            # the server falls back to the original
+            remove_siblings(path, [fmt])
+            continue
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(compressed)
+        # readable by the server and with the modified time of the original
+        os.chmod(tmp_path, stat.st_mode & 0o777)
+        os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp_path, out_path)
+
+
+@timed
+def compress_output(app: Sphinx, exception: Optional[Exception]):
+    """Compress changed output files on a process pool."""
+    if exception is not None or app.builder.format != "html":
+        return
+
+    formats = [fmt for fmt in app.config.compress_formats if fmt in ENCODERS]
+    previous = read_cache(app)
+    cache: Dict[str, str] = {}
+    pending = []
+    for relpath in compressible(app):
+        path = os.path.join(app.builder.outdir, relpath)
+        key = file_key(path, formats)
+        cache[relpath] = key
+        if previous.get(relpath) != key:
+            pending.append(path)
+
+    # siblings of files removed from the output or now too small
+    for relpath in previous.keys() - cache.keys():
+        remove_siblings(os.path.join(app.builder.outdir, relpath), list(ENCODERS))
+
+    if pending:
+        logger.info("compressing %d files", len(pending))
+        with ProcessPoolExecutor(
+            max_workers=app.config.compress_jobs or None
+        ) as executor:
+            # list() re-raises the first failure
+            list(
+                executor.map(compress, pending, [formats] * len(pending), chunksize=16)
+            )
+
+    with open(cache_path(app), "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    app.setup_extension("sphinx_timing")
+    app.add_config_value("compress_formats", ["gz", "br", "zst"], "", types=[list])
+    app.add_config_value(
+        "compress_suffixes",
+        [".css", ".html", ".js", ".json", ".svg", ".txt", ".xml"],
+        "",
+        types=[list],
+    )
+    # below this size the headers outweigh the savings
+    app.add_config_value("compress_min_size", 256, "", types=[int])
+    app.add_config_value("compress_jobs", 0, "", types=[int])
+    # after other extensions wrote their files, like the sitemap
+    app.connect("build-finished", compress_output, priority=900)
+    return {
+        "version": "1.0.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,215 @@
+"""Content hashed names for static assets"""
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import os
+import posixpath
+import re
+import time
+import urllib.parse
+from sphinx_compress import ENCODERS
+from sphinx_images import VARIANT_NAME
+from sphinx_timing import timed
+
+logger = logging.getLogger(__name__)
+
+# attributes of HTML tags that hold URLs
+URL_ATTRIBUTE = re.compile(r'\b(href|src|srcset|content)="([^"]*)"')
+CSS_URL = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+HASH_LENGTH = 16
+FINGERPRINTED_NAME = re.compile(r"\.[0-9a-f]{%d}\.[^.]+$" % HASH_LENGTH)
+
+_build_start: float = 0.0
+
+
+def cache_path(app: Sphinx) -> str:
+    """Content hashed names of the assets of the last build."""
+    return os.path.join(app.doctreedir, "fingerprint.json")
+
+
+def read_cache(app: Sphinx) -> Dict[str, str]:
+    try:
+        with open(cache_path(app), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def fingerprinted_name(relpath: str, data: bytes) -> str:
+    root, ext = posixpath.splitext(relpath)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def find_assets(app: Sphinx) -> List[str]:
+    """Files in the asset directories, relative to the output directory."""
+    # compressed siblings are written after this
+    suffixes = tuple(f".{fmt}" for fmt in ENCODERS) + (".tmp",)
+    assets = []
+    for directory in app.config.fingerprint_dirs:
+        for dirpath, dirnames, filenames in os.walk(
+            os.path.join(app.builder.outdir, directory)
+        ):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                relpath = os.path.relpath(
+                    os.path.join(dirpath, filename), app.builder.outdir
+                ).replace(os.sep, "/")
+                if not filename.endswith(suffixes):
+                    assets.append(relpath)
+    return assets
+
+
+def rewrite_url(url: str, base: str, lookup: Dict[str, str]) -> str:
+    """*url* pointing to the fingerprinted name of an asset, if it is one.
+
+    *base* is the directory of the referencing file, relative to the output
+    directory.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme or parts.netloc or not parts.path:
+        return url
+    path = urllib.parse.unquote(parts.path)
+    if path.startswith("/"):
+        target = posixpath.normpath(path.lstrip("/"))
+    else:
+        target = posixpath.normpath(posixpath.join(base, path))
+    if target not in lookup:
+        return url
+    name = posixpath.basename(lookup[target])
+    new_path = posixpath.join(posixpath.dirname(parts.path), urllib.parse.quote(name))
+    # the name replaces the ?v= cache buster
+    return urllib.parse.urlunsplit(("", "", new_path, "", parts.fragment))
+
+
+def rewrite_html(html: str, base: str, lookup: Dict[str, str]) -> str:
+    def replace(match: re.Match) -> str:
+        attribute, value = match.groups()
+        if attribute == "srcset":
+            candidates = []
+            for candidate in value.split(","):
+                url, _, descriptor = candidate.strip().partition(" ")
+                url = rewrite_url(url, base, lookup)
+                candidates.append(f"{url} {descriptor}" if descriptor else url)
+            value = ", ".join(candidates)
+        else:
+            value = rewrite_url(value, base, lookup)
+        return f'{attribute}="{value}"'
+
+    return URL_ATTRIBUTE.sub(replace, html)
+
+
+def rewrite_css(css: str, base: str, lookup: Dict[str, str]) -> str:
+    def replace(match: re.Match) -> str:
+        quote, url = match.groups()
+        return f"url({quote}{rewrite_url(url, base, lookup)}{quote})"
+
+    return CSS_URL.sub(replace, css)
+
+
+def note_build_start(app: Sphinx):
+    global _build_start
+    _build_start = time.time()
+
+
+@timed
+def fingerprint_assets(app: Sphinx, exception: Optional[Exception]):
+    """Copy assets to content hashed names and point the HTML at them.
+
+    The original names stay for references from scripts, feeds and other
+    sites. HTML written by earlier builds is only rewritten when a name
+    changed.
+    """
+    if exception is not None or app.builder.format != "html":
+        return
+
+    outdir = app.builder.outdir
+    previous = read_cache(app)
+    files = find_assets(app)
+    # copies written by earlier builds, known by name even without the cache
+    fingerprinted = {f for f in files if FINGERPRINTED_NAME.search(f)}
+
+    names: Dict[str, str] = {}
+    assets = []
+    for relpath in files:
+        if VARIANT_NAME.match(posixpath.basename(relpath)):
+            # image variants are content addressed already
+            names[relpath] = relpath
+        elif relpath not in fingerprinted:
+            assets.append(relpath)
+    # stylesheets last, they point at the other assets
+    for relpath in sorted(assets, key=lambda relpath: relpath.endswith(".css")):
+        with open(os.path.join(outdir, relpath), "rb") as f:
+            data = f.read()
+        if relpath.endswith(".css"):
+            css = data.decode("utf-8", "surrogateescape")
+            css = rewrite_css(css, posixpath.dirname(relpath), names)
+            data = css.encode("utf-8", "surrogateescape")
+        names[relpath] = fingerprinted_name(relpath, data)
+        path = os.path.join(outdir, names[relpath])
+        # the name changes with the content
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+
+    for name in fingerprinted - set(names.values()):
+        os.remove(os.path.join(outdir, name))
+
+    # names from earlier builds point at the current ones
+    lookup = {}
+    for name in fingerprinted:
+        root, ext = posixpath.splitext(name)
+        relpath = posixpath.splitext(root)[0] + ext
+        if relpath in names:
+            lookup[name] = names[relpath]
+    lookup.update(names)
+
+    rewritten = 0
+    for dirpath, dirnames, filenames in os.walk(outdir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in filenames:
+            if not filename.endswith(".html"):
+                continue
+            path = os.path.join(dirpath, filename)
+            if names == previous and os.stat(path).st_mtime < _build_start:
+                # written by an earlier build with the same names
+                continue
+            with open(path, encoding="utf-8") as f:
+                html = f.read()
+            base = os.path.relpath(dirpath, outdir).replace(os.sep, "/")
+            new_html = rewrite_html(html, "" if base == "." else base, lookup)
+            if new_html != html:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(new_html)
+                rewritten += 1
+    logger.info("fingerprinted %d assets, rewrote %d pages", len(names), rewritten)
+
+    if app.config.fingerprint_manifest:
+        manifest = {
+            "immutable": sorted("/" + name for name in names.values()),
+            "assets": {"/" + k: "/" + v for k, v in sorted(names.items())},
+        }
+        with open(
+            os.path.join(outdir, app.config.fingerprint_manifest), "w", encoding="utf-8"
+        ) as f:
+            json.dump(manifest, f, indent=1)
+
+    with open(cache_path(app), "w", encoding="utf-8") as f:
+        json.dump(names, f)
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    app.setup_extension("sphinx_timing")
+    app.add_config_value("fingerprint_dirs", ["_static", "_images"], "", types=[list])
+    # paths that can be served with Cache-Control: immutable
+    app.add_config_value("fingerprint_manifest", "immutable.json", "", types=[str])
+    app.connect("builder-inited", note_build_start)
+    # before the compressed siblings are written
+    app.connect("build-finished", fingerprint_assets, priority=800)
+    return {
+        "version": "1.0.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
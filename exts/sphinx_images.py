@@ -0,0 +1,344 @@
+"""Responsive image variants for Sphinx"""
+
+from sphinx.addnodes import document
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+from sphinx.util.docutils import nodes
+from typing import Any, List, Dict, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import urllib.parse
+from sphinx_timing import timed
+
+logger = logging.getLogger(__name__)
+
+# formats Sphinx copies as is, SVG is already small and sharp at any size
+RASTER_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+# names of the variants in the output, content addressed by the cache key
+VARIANT_NAME = re.compile(r"^[0-9a-f]{16}-\d+\.\w+$")
+# bumped when the same image and settings give other variants
+CACHE_VERSION = 2
+
+
+def cache_dir(app: Sphinx) -> str:
+    """Directory of image variants, kept between builds."""
+    return app.config.images_cache_dir or os.path.join(app.doctreedir, "images")
+
+
+def image_formats(app: Sphinx) -> List[str]:
+    from PIL import features
+
+    # AVIF support depends on how Pillow was built
+    return [fmt for fmt in app.config.images_formats if features.check(fmt)]
+
+
+def cache_key(app: Sphinx, data: bytes) -> str:
+    """Content hash of the image and everything that affects the variants."""
+    import PIL
+
+    digest = hashlib.sha256()
+    settings = [
+        CACHE_VERSION,
+        PIL.__version__,
+        app.config.images_widths,
+        image_formats(app),
+        app.config.images_quality,
+    ]
+    digest.update(json.dumps(settings).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def optimize(
+    source: str,
+    path: str,
+    widths: List[int],
+    formats: List[str],
+    quality: Dict[str, int],
+) -> Dict[str, Any]:
+    """Write resized and recompressed variants of *source* to *path*."""
+    from PIL import Image, ImageOps
+
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path), suffix=".tmp")
+
+    with Image.open(source) as image:
+        # the variants are saved without EXIF, rotate the pixels instead
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.mode or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        meta = {"width": width, "height": height, "variants": {}}
+        variant_widths = sorted({w for w in widths if w < width} | {width})
+        for variant_width in variant_widths:
+            if variant_width == width:
+                variant = image
+            else:
+                variant_height = max(1, round(height * variant_width / width))
+                variant = image.resize(
+                    (variant_width, variant_height), Image.Resampling.LANCZOS
+                )
+            for fmt in formats:
+                name = f"{variant_width}.{fmt}"
+                variant.save(os.path.join(tmp_path, name), fmt, quality=quality[fmt])
+                meta["variants"].setdefault(fmt, []).append([variant_width, name])
+
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # rendered by another process in the meantime
+        shutil.rmtree(tmp_path)
+    return meta
+
+
+def read_meta(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    # mark as recently used for eviction
+    os.utime(path)
+    return meta
+
+
+@timed
+def collect_images(app: Sphinx, doctree: document):
+    """Note raster images to optimize."""
+    env = app.builder.env
+    for node in doctree.findall(nodes.image):
+        candidate = node.get("candidates", {}).get("*", "")
+        if not candidate.lower().endswith(RASTER_SUFFIXES):
+            continue
+
+        source = os.path.join(app.srcdir, candidate)
+        try:
+            with open(source, "rb") as f:
+                key = cache_key(app, f.read())
+        except FileNotFoundError:
+            # the image collector warns about it, written as is
+            continue
+        node["image_key"] = key
+
+        if not os.path.isdir(os.path.join(cache_dir(app), key)):
+            env.images_pending[key] = source
+
+
+def init_images_env(app: Sphinx, env: BuildEnvironment, docnames: List[str]):
+    env.images_pending = {}
+
+
+def merge_images_pending(
+    app: Sphinx, env: BuildEnvironment, docnames: Set[str], other: BuildEnvironment
+):
+    """Merge images found by a parallel reader process."""
+    env.images_pending.update(other.images_pending)
+
+
+@timed
+def optimize_pending(app: Sphinx, env: BuildEnvironment):
+    """Optimize all images missing from the cache at once."""
+    pending: Dict[str, str] = env.images_pending
+    env.images_pending = {}
+    if not pending:
+        return
+
+    path = cache_dir(app)
+    os.makedirs(path, exist_ok=True)
+
+    def optimize_one(key: str):
+        optimize(
+            pending[key],
+            os.path.join(path, key),
+            app.config.images_widths,
+            image_formats(app),
+            app.config.images_quality,
+        )
+
+    logger.info("optimizing %d images", len(pending))
+    with ThreadPoolExecutor(max_workers=app.config.images_jobs or None) as executor:
+        # list() re-raises the first failure
+        list(executor.map(optimize_one, pending))
+
+
+@timed
+def resolve_images(app: Sphinx, doctree: document, docname: str):
+    """Copy the variants of optimized images to the output directory."""
+    if app.builder.format != "html":
+        return
+
+    out_path = os.path.join(app.builder.outdir, app.builder.imagedir)
+    for node in doctree.findall(nodes.image):
+        key = node.get("image_key")
+        if key is None:
+            continue
+
+        path = os.path.join(cache_dir(app), key)
+        meta = read_meta(path)
+        if meta is None:
+            # removed from the cache since this document was read
+            os.makedirs(cache_dir(app), exist_ok=True)
+            meta = optimize(
+                os.path.join(app.srcdir, node["candidates"]["*"]),
+                path,
+                app.config.images_widths,
+                image_formats(app),
+                app.config.images_quality,
+            )
+
+        os.makedirs(out_path, exist_ok=True)
+        srcsets = {}
+        for fmt, variants in meta["variants"].items():
+            srcset = []
+            for width, name in variants:
+                # content addressed, an existing file is up to date
+                out_name = f"{key[:16]}-{name}"
+                out_file = os.path.join(out_path, out_name)
+                if not os.path.exists(out_file):
+                    shutil.copyfile(os.path.join(path, name), out_file)
+                srcset.append([out_name, width])
+            srcsets[fmt] = srcset
+
+        node["image_width"] = meta["width"]
+        node["image_height"] = meta["height"]
+        node["image_srcsets"] = srcsets
+
+
+def scale_length(length: str, scale: float) -> str:
+    match = re.match(r"^([0-9.]+)(.*)$", length)
+    if match is None:
+        return length
+    return f"{float(match.group(1)) * scale:g}{match.group(2)}"
+
+
+def image_style(node: nodes.image) -> str:
+    """CSS size from the width, height and scale options, like the HTML5
+    translator."""
+    size = {name: node[name] for name in ["width", "height"] if name in node}
+    if "scale" in node:
+        size = {name: scale_length(v, node["scale"] / 100) for name, v in size.items()}
+    style = []
+    for name in ["width", "height"]:
+        if name in size:
+            value = size[name]
+            if re.match(r"^[0-9.]+$", value):
+                value += "px"
+            style.append(f"{name}: {value};")
+        elif size:
+            # keep the aspect ratio of the width and height attributes
+            style.append(f"{name}: auto;")
+    return " ".join(style)
+
+
+def visit_image(self, node: nodes.image):
+    if "image_srcsets" not in node:
+        return type(self).visit_image(self, node)
+
+    # same URI rewriting as the HTML5 translator
+    olduri = node["uri"]
+    if olduri in self.builder.images:
+        node["uri"] = posixpath.join(
+            self.builder.imgpath, urllib.parse.quote(self.builder.images[olduri])
+        )
+    if "align" in node:
+        node["classes"].append(f"align-{node['align']}")
+
+    # the intrinsic size reserves the space of the image before it loads
+    width = node["image_width"]
+    height = node["image_height"]
+    style = image_style(node)
+    if "scale" in node and not style:
+        width = round(width * node["scale"] / 100)
+        height = round(height * node["scale"] / 100)
+    attributes = {"style": style} if style else {}
+    sizes = f"(max-width: {width}px) 100vw, {width}px"
+    if re.match(r"^[0-9.]+(px)?$", node.get("width", "")) and "scale" not in node:
+        sizes = node["width"].removesuffix("px") + "px"
+    self.body.append("<picture>")
+    for fmt, srcset in node["image_srcsets"].items():
+        srcset = ", ".join(
+            f"{posixpath.join(self.builder.imgpath, name)} {w}w" for name, w in srcset
+        )
+        self.body.append(
+            f'<source type="image/{fmt}" srcset="{srcset}" sizes="{sizes}" />'
+        )
+    self.body.append(
+        self.emptytag(
+            node,
+            "img",
+            "",
+            src=node["uri"],
+            alt=node.get("alt", node["uri"]),
+            width=str(width),
+            height=str(height),
+            loading="lazy",
+            decoding="async",
+            **attributes,
+        )
+    )
+    self.body.append("</picture>")
+
+
+def depart_image(self, node: nodes.image):
+    if "image_srcsets" not in node:
+        return type(self).depart_image(self, node)
+
+
+def evict_cache(app: Sphinx, exception: Optional[Exception]):
+    """Remove the least recently used images until the cache fits."""
+    path = cache_dir(app)
+    if not os.path.isdir(path):
+        return
+
+    entries = []
+    total_size = 0
+    for entry in os.scandir(path):
+        if not entry.is_dir() or entry.name.endswith(".tmp"):
+            continue
+        size = sum(variant.stat().st_size for variant in os.scandir(entry.path))
+        entries.append((entry.stat().st_mtime, size, entry.path))
+        total_size += size
+
+    for _, size, entry_path in sorted(entries):
+        if total_size <= app.config.images_cache_size:
+            break
+        shutil.rmtree(entry_path)
+        total_size -= size
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    app.setup_extension("sphinx_timing")
+    app.add_config_value("images_cache_dir", None, "", types=[str, type(None)])
+    app.add_config_value("images_cache_size", 256 * 1024 * 1024, "", types=[int])
+    app.add_config_value("images_widths", [480, 960, 1440], "env", types=[list])
+    app.add_config_value("images_formats", ["avif", "webp"], "env", types=[list])
+    # AVIF reaches the same visual quality as WebP at a lower setting
+    app.add_config_value(
+        "images_quality", {"avif": 60, "webp": 80}, "env", types=[dict]
+    )
+    app.add_config_value("images_jobs", 0, "", types=[int])
+    app.add_node(nodes.image, override=True, html=(visit_image, depart_image))
+    app.connect("env-before-read-docs", init_images_env)
+    # after the image collector resolved candidates
+    app.connect("doctree-read", collect_images, priority=600)
+    app.connect("env-merge-info", merge_images_pending)
+    app.connect("env-updated", optimize_pending)
+    app.connect("doctree-resolved", resolve_images)
+    app.connect("build-finished", evict_cache)
+    return {
+        "version": "1.0.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
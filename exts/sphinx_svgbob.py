@@ -1,9 +1,135 @@
 """Svgbob extension for Sphinx"""
 
+from sphinx.addnodes import document
 from sphinx.application import Sphinx
+from sphinx.config import Config
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective, nodes
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+import functools
+import hashlib
+import os
+import re
+import shutil
 import subprocess
+import tempfile
+from sphinx_timing import measure, timed
+
+logger = logging.getLogger(__name__)
+
+SVGBOB_ARGS: List[str] = [
+    "svgbob",
+    "--stroke-color", "currentColor",
+    "--fill-color", "currentColor",
+    "--background", "transparent",
+]  # fmt: skip
+
+SVG_NS = "http://www.w3.org/2000/svg"
+ElementTree.register_namespace("", SVG_NS)
+
+NUMBER = re.compile(r"-?\d*\.\d+")
+# svgbob emits the same style and marker definitions in every diagram
+SHARED = re.compile(r"<style>.*?</style>|<defs>.*?</defs>", re.DOTALL)
+
+
+@functools.cache
+def svgbob_binary() -> str:
+    """Path, size and modification time of the svgbob binary.
+
+    Changes with every update of svgbob, without running it on a warm cache.
+    """
+    path = shutil.which(SVGBOB_ARGS[0])
+    if path is None:
+        # no cached diagram matches, rendering reports the missing binary
+        return ""
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def cache_dir(config: Config, doctreedir: str) -> str:
+    """Directory of rendered diagrams, kept between builds."""
+    return config.svgbob_cache_dir or os.path.join(doctreedir, "svgbob")
+
+
+def cache_key(source: str, args: List[str], precision: int) -> str:
+    """Content hash of everything that affects the rendered SVG."""
+    digest = hashlib.sha256()
+    for part in [svgbob_binary(), *args, f"precision={precision}", source]:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def cache_read(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            svg = f.read()
+    except FileNotFoundError:
+        return None
+    # mark as recently used for eviction
+    os.utime(path)
+    return svg
+
+
+def cache_write(path: str, svg: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename so parallel readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(svg)
+    os.replace(tmp_path, path)
+
+
+def round_numbers(value: str, precision: int) -> str:
+    def round_number(match: re.Match) -> str:
+        number = f"{float(match.group()):.{precision}f}"
+        if "." in number:
+            number = number.rstrip("0").rstrip(".")
+        return "0" if number == "-0" else number
+
+    return NUMBER.sub(round_number, value)
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r" ?([{};:,]) ?", r"\1", css).replace(";}", "}").strip()
+
+
+def optimize(svg: str, precision: int) -> str:
+    """Minify svgbob output and round its coordinates."""
+    root = ElementTree.fromstring(svg)
+    for element in root.iter():
+        for name, value in list(element.attrib.items()):
+            if name not in ("class", "id"):
+                element.set(name, round_numbers(value, precision))
+        if element.tag == f"{{{SVG_NS}}}style":
+            element.text = minify_css(element.text or "")
+        elif element.text is not None and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+    return ElementTree.tostring(root, encoding="unicode")
+
+
+def render(source: str, args: List[str], precision: int) -> str:
+    proc = subprocess.run(
+        args,
+        input=source,
+        stdout=subprocess.PIPE,
+        encoding="utf-8",
+        check=True,
+    )
+    return optimize(proc.stdout, precision)
+
+
+class SvgbobNode(nodes.General, nodes.Element):
+    """Placeholder for a diagram, replaced with the SVG when resolved."""
+
+    pass
 
 
 class SvgbobDirective(SphinxDirective):
@@ -22,31 +148,118 @@ class SvgbobDirective(SphinxDirective):
     def run(self) -> List[nodes.Node]:
         source: str = "\n".join(self.content)
 
-        args = [
-            "svgbob",
-            "--stroke-color", "currentColor",
-            "--fill-color", "currentColor",
-            "--background", "transparent",
-        ]  # fmt: skip
+        key = cache_key(source, SVGBOB_ARGS, self.config.svgbob_precision)
+        node = SvgbobNode(key=key, source=source)
+        self.set_source_info(node)
+
+        path = os.path.join(cache_dir(self.config, self.env.doctreedir), key + ".svg")
+        if os.path.exists(path):
+            # mark as recently used for eviction
+            os.utime(path)
+        else:
+            self.env.svgbob_pending[key] = (self.env.docname, source)
+
+        return [node]
+
+
+def init_svgbob_env(app: Sphinx, env: BuildEnvironment, docnames: List[str]):
+    env.svgbob_pending = {}
+
 
-        proc = subprocess.run(
-            args,
-            input=source,
-            stdout=subprocess.PIPE,
-            encoding="utf-8",
-            check=True,
-        )
+def merge_svgbob_pending(
+    app: Sphinx, env: BuildEnvironment, docnames: Set[str], other: BuildEnvironment
+):
+    """Merge diagrams found by a parallel reader process."""
+    env.svgbob_pending.update(other.svgbob_pending)
 
-        svg: str = proc.stdout
 
+@timed
+def render_pending(app: Sphinx, env: BuildEnvironment):
+    """Render all diagrams missing from the cache at once."""
+    pending: Dict[str, Tuple[str, str]] = env.svgbob_pending
+    env.svgbob_pending = {}
+    if not pending:
+        return
+
+    path = cache_dir(app.config, app.doctreedir)
+
+    def render_one(key: str):
+        docname, source = pending[key]
+        with measure(app, "svgbob", key, docname):
+            svg = render(source, SVGBOB_ARGS, app.config.svgbob_precision)
+        cache_write(os.path.join(path, key + ".svg"), svg)
+
+    logger.info("rendering %d svgbob diagrams", len(pending))
+    with ThreadPoolExecutor(max_workers=app.config.svgbob_jobs) as executor:
+        # list() re-raises the first render failure
+        list(executor.map(render_one, pending))
+
+
+@timed
+def resolve_diagrams(app: Sphinx, doctree: document, docname: str):
+    """Replace `SvgbobNode` placeholders with inline SVGs.
+
+    The style and marker definitions shared by the diagrams of a page are
+    written once, in a hidden SVG before the first diagram.
+    """
+    path = cache_dir(app.config, app.doctreedir)
+    shared_blocks: Set[str] = set()
+    for node in doctree.findall(SvgbobNode):
+        svg_path = os.path.join(path, node["key"] + ".svg")
+        svg = cache_read(svg_path)
+        if svg is None:
+            # evicted since this document was read
+            with measure(app, "svgbob", node["key"], docname):
+                svg = render(node["source"], SVGBOB_ARGS, app.config.svgbob_precision)
+            cache_write(svg_path, svg)
+
+        shared = "".join(SHARED.findall(svg))
+        html = ""
+        if shared and shared not in shared_blocks:
+            shared_blocks.add(shared)
+            html += (
+                f'<svg xmlns="{SVG_NS}" width="0" height="0" aria-hidden="true"'
+                f' style="position:absolute">{shared}</svg>'
+            )
         # use inline SVGs to inherit theme colors
-        raw_node = nodes.raw("", f"<div>{svg}</div>", format="html")
+        html += f"<div>{SHARED.sub('', svg)}</div>"
+        node.replace_self(nodes.raw("", html, format="html"))
+
+
+def evict_cache(app: Sphinx, exception: Optional[Exception]):
+    """Remove the least recently used diagrams until the cache fits."""
+    path = cache_dir(app.config, app.doctreedir)
+    if not os.path.isdir(path):
+        return
+
+    entries = []
+    total_size = 0
+    for entry in os.scandir(path):
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size += stat.st_size
 
-        return [raw_node]
+    for _, size, entry_path in sorted(entries):
+        if total_size <= app.config.svgbob_cache_size:
+            break
+        os.remove(entry_path)
+        total_size -= size
 
 
 def setup(app: Sphinx) -> Dict[str, Any]:
+    app.setup_extension("sphinx_timing")
+    app.add_node(SvgbobNode)
     app.add_directive("svgbob", SvgbobDirective)
+    app.add_config_value("svgbob_cache_dir", None, "", types=[str, type(None)])
+    app.add_config_value("svgbob_cache_size", 64 * 1024 * 1024, "", types=[int])
+    app.add_config_value("svgbob_jobs", None, "", types=[int, type(None)])
+    # decimal places kept in coordinates
+    app.add_config_value("svgbob_precision", 1, "env", types=[int])
+    app.connect("env-before-read-docs", init_svgbob_env)
+    app.connect("env-merge-info", merge_svgbob_pending)
+    app.connect("env-updated", render_pending)
+    app.connect("doctree-resolved", resolve_diagrams)
+    app.connect("build-finished", evict_cache)
     return {
         "version": "1.0.0",
         "parallel_read_safe": True,
@@ -0,0 +1,185 @@
+"""Build timing report for the local Sphinx extensions"""
+
+from sphinx.addnodes import document
+from sphinx.application import Sphinx
+from sphinx.util import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import contextlib
+import functools
+import inspect
+import json
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# parallel builds fork, so every process appends to its own file
+_lock = threading.Lock()
+_read_start: Dict[str, float] = {}
+_build_start: float = 0.0
+
+
+def enabled(app: Sphinx) -> bool:
+    return bool(app.config.timing_report)
+
+
+def records_dir(app: Sphinx) -> str:
+    return os.path.join(app.doctreedir, "timing")
+
+
+def record(app: Sphinx, kind: str, name: str, docname: Optional[str], seconds: float):
+    line = json.dumps(
+        {"kind": kind, "name": name, "docname": docname, "seconds": seconds}
+    )
+    path = os.path.join(records_dir(app), f"{os.getpid()}.jsonl")
+    with _lock:
+        # the report of an earlier build removed it
+        os.makedirs(records_dir(app), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextlib.contextmanager
+def measure(
+    app: Sphinx, kind: str, name: str, docname: Optional[str] = None
+) -> Iterator[None]:
+    """Record the wall time of the block when timing is enabled."""
+    if not enabled(app):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(app, kind, name, docname, time.perf_counter() - start)
+
+
+def _docname(app: Sphinx, args: tuple) -> Optional[str]:
+    # doctree-resolved and env-purge-doc pass the docname
+    for arg in args:
+        if isinstance(arg, str):
+            return arg
+    # doctree-read runs while the document is current
+    return app.env.docname or None
+
+
+def timed(handler: Callable) -> Callable:
+    """Record the wall time of an event handler."""
+    if inspect.isgeneratorfunction(handler):
+
+        @functools.wraps(handler)
+        def generator_wrapper(app: Sphinx, *args):
+            with measure(app, "hook", handler.__name__, _docname(app, args)):
+                yield from handler(app, *args)
+
+        return generator_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(app: Sphinx, *args):
+        with measure(app, "hook", handler.__name__, _docname(app, args)):
+            return handler(app, *args)
+
+    return wrapper
+
+
+def start_timing(app: Sphinx):
+    global _build_start
+    if not enabled(app):
+        return
+    shutil.rmtree(records_dir(app), ignore_errors=True)
+    os.makedirs(records_dir(app))
+    _build_start = time.perf_counter()
+
+
+def start_read(app: Sphinx, docname: str, source: List[str]):
+    if enabled(app):
+        _read_start[docname] = time.perf_counter()
+
+
+def end_read(app: Sphinx, doctree: document):
+    docname = app.env.docname
+    start = _read_start.pop(docname, None)
+    if start is not None:
+        record(app, "read", "read", docname, time.perf_counter() - start)
+
+
+def slowest(entries: Dict[Any, float], top: int) -> List[Any]:
+    return sorted(entries.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def write_report(app: Sphinx, exception: Optional[Exception]):
+    """Aggregate the records of all processes into the JSON report."""
+    if not enabled(app) or not os.path.isdir(records_dir(app)):
+        return
+
+    records = []
+    for entry in os.scandir(records_dir(app)):
+        with open(entry.path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    shutil.rmtree(records_dir(app))
+
+    hooks: Dict[str, Dict[str, Any]] = {}
+    documents: Dict[str, Dict[str, float]] = {}
+    diagrams: Dict[tuple, float] = {}
+    for entry in records:
+        if entry["kind"] == "hook":
+            hook = hooks.setdefault(
+                entry["name"], {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            hook["calls"] += 1
+            hook["seconds"] += entry["seconds"]
+            hook["max_seconds"] = max(hook["max_seconds"], entry["seconds"])
+        elif entry["kind"] == "svgbob":
+            diagrams[(entry["docname"], entry["name"])] = entry["seconds"]
+        if entry["docname"] is not None and entry["kind"] in ("hook", "read"):
+            # kept apart, reading includes the doctree-read hooks
+            document = documents.setdefault(
+                entry["docname"], {"read_seconds": 0.0, "hook_seconds": 0.0}
+            )
+            document[f"{entry['kind']}_seconds"] += entry["seconds"]
+
+    top = app.config.timing_report_top
+    report = {
+        "seconds": time.perf_counter() - _build_start,
+        "hooks": dict(
+            sorted(hooks.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        ),
+        "documents": [
+            {"docname": docname, **seconds}
+            for docname, seconds in sorted(
+                documents.items(),
+                key=lambda item: (
+                    item[1]["read_seconds"],
+                    item[1]["hook_seconds"],
+                ),
+                reverse=True,
+            )[:top]
+        ],
+        "diagrams": [
+            {"docname": docname, "key": key, "seconds": seconds}
+            for (docname, key), seconds in slowest(diagrams, top)
+        ],
+    }
+
+    path = os.path.abspath(app.config.timing_report)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info("timing report written to %s", path)
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    # path of the JSON report relative to the working directory
+    app.add_config_value("timing_report", None, "", types=[str, type(None)])
+    app.add_config_value("timing_report_top", 20, "", types=[int])
+    app.connect("builder-inited", start_timing)
+    app.connect("source-read", start_read, priority=0)
+    app.connect("doctree-read", end_read, priority=999)
+    # after the build-finished handlers it times
+    app.connect("build-finished", write_report, priority=1000)
+    return {
+        "version": "1.0.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
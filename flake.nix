@@ -38,22 +38,26 @@
 
           nativeBuildInputs = [
             pkgs.svgbob
+            pkgs.python3.pkgs.brotli
             pkgs.python3.pkgs.dateutils
-            pkgs.python3.pkgs.feedgen
             pkgs.python3.pkgs.furo
             pkgs.python3.pkgs.myst-parser
+            pkgs.python3.pkgs.pillow
             pkgs.python3.pkgs.sphinx
             pkgs.python3.pkgs.sphinx-copybutton
             pkgs.python3.pkgs.sphinx-favicon
             pkgs.python3.pkgs.sphinx-sitemap
             pkgs.python3.pkgs.sphinxcontrib-spelling
             pkgs.python3.pkgs.sphinxext-rediraffe
+            pkgs.python3.pkgs.zstandard
           ];
 
           env.NIX_LAST_MODIFIED_DATE = self.lastModifiedDate;
 
+          # the doctrees and caches of the build are not part of the site
           buildPhase = ''
-            sphinx-build -b dirhtml --fail-on-warning $src/content $out
+            sphinx-build -b dirhtml --fail-on-warning \
+              -d $TMPDIR/doctrees $src/content $out
             touch $out/.nojekyll
           '';
 
@@ -93,6 +97,21 @@
       in {
         inherit site;
 
+        # a second build without changes writes no documents, the generated
+        # pages and feeds must not depend on state set up by writing them
+        rebuild = site.overrideAttrs {
+          name = "rebuild";
+          buildPhase = ''
+            for build in first second; do
+              echo "$build build"
+              sphinx-build -b dirhtml --fail-on-warning \
+                -D blog_split_listings=1 -D blog_feed_content=1 \
+                -d $TMPDIR/doctrees $src/content $TMPDIR/html
+            done
+            touch $out
+          '';
+        };
+
         formatting =
           (
             (treefmt.lib.evalModule pkgs (
@@ -182,6 +201,11 @@
             touch $out
           '';
 
+        metadata = pkgs.runCommand "blog-metadata" {} ''
+          ${pkgs.python3}/bin/python3 ${self}/exts/blog_metadata.py ${self}/content
+          touch $out
+        '';
+
         exif = pkgs.runCommand "exiftool" {} ''
           for image in ${self}/content/images/*.{jpg,png}; do
             data=$(${pkgs.exiftool}/bin/exiftool -GPS:all -n "$image")
@@ -196,17 +220,51 @@
           touch $out
         '';
 
-        spelling = self.packages.${system}.default.overrideAttrs (oA: {
-          name = "spelling";
-          env =
-            oA.env
-            // {
-              DICPATH = "${pkgs.hunspellDicts.en_US-large}/share/hunspell";
-            };
-          buildPhase = ''
-            sphinx-build -b spelling --fail-on-warning content $out
-          '';
-        });
+        # one derivation per post, keyed by the files its check reads, so
+        # unchanged posts are substituted from the binary cache
+        spelling = let
+          inherit (pkgs) lib;
+          hidden = path:
+            lib.any (lib.hasPrefix ".") (lib.splitString "/" path)
+            || lib.any (lib.hasPrefix "_") (lib.splitString "/" path);
+          documents =
+            builtins.filter
+            (path: lib.hasSuffix ".md" path && !hidden path)
+            (map (path: lib.removePrefix "${toString ./content}/" (toString path))
+              (lib.filesystem.listFilesRecursive ./content));
+          # posts are checked with their directory, other pages alone
+          units = lib.unique (map (
+              path:
+                if dirOf path == "."
+                then path
+                else dirOf path
+            )
+            documents);
+          check = unit:
+            site.overrideAttrs (oA: {
+              name = "spelling-${lib.replaceStrings ["/" "."] ["-" "-"] unit}";
+              src = lib.fileset.toSource {
+                root = ./.;
+                fileset = lib.fileset.unions [
+                  ./exts
+                  ./content/conf.py
+                  ./content/spelling_wordlist.txt
+                  (./content + "/${unit}")
+                ];
+              };
+              env =
+                oA.env
+                // {
+                  DICPATH = "${pkgs.hunspellDicts.en_US-large}/share/hunspell";
+                };
+              buildPhase = ''
+                python3 exts/blog_spelling.py --jobs 1 \
+                  --cache-dir $TMPDIR/spelling content
+                touch $out
+              '';
+            });
+        in
+          pkgs.linkFarmFromDrvs "spelling" (map check units);
       }
     );
   };